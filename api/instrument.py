@@ -0,0 +1,86 @@
+""" Request metrics and per-request profiling for the API.
+
+`MetricsMiddleware` times every HTTP request into `synth_http_request_duration_seconds` (by method, route
+template and status). A request sent with `X-Profile: 1` gets a `Server-Timing` response header with the time
+spent per pipeline stage while handling it (see `telemetry/stages.py`), summed over repeated stages, plus the
+total as `app`, e.g.
+
+    Server-Timing: render;dur=17.2, png_encode;dur=4.1, app;dur=22.9
+
+Stages run in a render worker process show up as a single `render_worker` entry. For a streamed response the
+header only covers the work done before the first byte. `app_gauges` registers the gauges computed from the app
+state at scrape time. """
+
+import time
+
+from telemetry.metrics import Counter, Gauge, Histogram
+from telemetry.stages import profile
+
+PROFILE_HEADER = b"x-profile"
+
+HTTP_SECONDS = Histogram("synth_http_request_duration_seconds", "HTTP request latency.", ("method", "route", "status"))
+
+def server_timing(timings: list, total: float) -> str:
+    per_stage = {}
+    for name, seconds in timings:
+        per_stage[name] = per_stage.get(name, 0.0) + seconds
+    entries = [f"{name};dur={seconds * 1e3:.2f}" for name, seconds in per_stage.items()]
+    entries.append(f"app;dur={total * 1e3:.2f}")
+    return ", ".join(entries)
+
+def _wants_profile(scope) -> bool:
+    for name, value in scope.get("headers", ()):
+        if name == PROFILE_HEADER:
+            return value.strip().lower() not in (b"", b"0", b"false")
+    return False
+
+class MetricsMiddleware:
+    """ Plain ASGI middleware: unlike `BaseHTTPMiddleware` it runs the app in the same task, so the profiling
+    context reaches the endpoints and streamed responses keep seeing client disconnects. """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+        wants_profile = _wants_profile(scope)
+
+        with profile() as timings:
+            async def send_timed(message):
+                nonlocal status
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                    if wants_profile:
+                        value = server_timing(timings, time.perf_counter() - start)
+                        message = {**message, "headers": [*message.get("headers", ()), (b"server-timing", value.encode("ascii"))]}
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_timed)
+            finally:
+                route = getattr(scope.get("route"), "path", "unmatched")  # the template, not the raw path
+                HTTP_SECONDS.observe(time.perf_counter() - start, method=scope["method"], route=route, status=status)
+
+def app_gauges(state) -> None:
+    def jobs_by_status():
+        counts = {}
+        for job in state.jobs.list():
+            counts[(job.status,)] = counts.get((job.status,), 0) + 1
+        return counts
+
+    def export_throughput():
+        return sum(job.to_dict()["scenes_per_sec"] or 0.0 for job in state.jobs.list() if job.status == "running")
+
+    Gauge("synth_export_jobs", "Export jobs by status.", ("status",), function=jobs_by_status)
+    Gauge("synth_export_scenes_per_second", "Combined throughput of the running export jobs.", function=export_throughput)
+    Gauge("synth_render_cache_entries", "Renders held by the render cache.", function=lambda: state.render_cache.stats()["entries"])
+    Gauge("synth_render_cache_bytes", "Bytes held by the render cache.", function=lambda: state.render_cache.stats()["bytes"])
+    Counter("synth_render_cache_hits_total", "Render cache hits.", function=lambda: state.render_cache.stats()["hits"])
+    Counter("synth_render_cache_misses_total", "Render cache misses.", function=lambda: state.render_cache.stats()["misses"])
+    Gauge("synth_render_pending", "Distinct renders in flight.", function=state.offload.pending)
+    Gauge("synth_sessions", "Named scene sessions held by this worker.", function=lambda: len(state.sessions))
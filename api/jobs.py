@@ -0,0 +1,128 @@
+""" Background export jobs.
+
+`POST /dataset/export` used to block the HTTP request until every scene was written. Exports now run as jobs
+on a small set of dedicated runner threads (so they never occupy the FastAPI threadpool that serves the render
+endpoints). The queue of waiting jobs is bounded: once it is full, new exports are rejected instead of piling up. """
+
+import queue
+import threading
+import time
+import uuid
+
+from dataset.export import export_dataset
+
+class JobQueueFull(Exception):
+    pass
+
+class ExportJob:
+    def __init__(self, req, camera):
+        self.id = uuid.uuid4().hex
+        self.req = req
+        self.camera = camera
+        self.status = "queued"  # queued -> running -> done | failed | cancelled
+        self.done = 0
+        self.total = req.num_scenes
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel = threading.Event()
+
+    def cancel(self) -> None:
+        self._cancel.set()
+        if self.status == "queued":
+            self.status = "cancelled"
+            self.finished_at = time.time()
+
+    def to_dict(self) -> dict:
+        elapsed = None
+        throughput = None
+        eta = None
+        if self.started_at is not None:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+            if self.done and elapsed > 0:
+                throughput = self.done / elapsed
+                if self.status == "running":
+                    eta = (self.total - self.done) / throughput
+
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "out_dir": self.req.out_dir,
+            "done": self.done,
+            "total": self.total,
+            "elapsed_sec": elapsed,
+            "scenes_per_sec": throughput,
+            "eta_sec": eta,
+            "error": self.error,
+        }
+
+    def run(self) -> None:
+        if self._cancel.is_set():
+            return
+        self.status = "running"
+        self.started_at = time.time()
+        try:
+            export_dataset(self.req, self.camera, on_scene=self._on_scene, should_stop=self._cancel.is_set)
+            self.status = "cancelled" if self._cancel.is_set() and self.done < self.total else "done"
+        except Exception as e:
+            self.status = "failed"
+            self.error = f"{type(e).__name__}: {e}"
+        finally:
+            self.finished_at = time.time()
+
+    def _on_scene(self, done: int) -> None:
+        self.done = done
+
+class JobManager:
+    def __init__(self, max_queued: int = 4, max_running: int = 1, max_history: int = 100):
+        self.max_running = max_running
+        self.max_history = max_history
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._jobs = {}  # insertion ordered, oldest first
+        self._lock = threading.Lock()
+        self._runners = []
+
+    def submit(self, req, camera) -> ExportJob:
+        job = ExportJob(req, camera)
+        self._start_runners()
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+            raise JobQueueFull(f"export queue is full ({self._queue.maxsize} jobs waiting)")
+        with self._lock:
+            self._forget_finished()
+        return job
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> list:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def _forget_finished(self) -> None:
+        # caller holds the lock; only finished jobs are dropped, oldest first
+        excess = len(self._jobs) - self.max_history
+        for job_id in [j.id for j in self._jobs.values() if j.finished_at is not None][:max(0, excess)]:
+            del self._jobs[job_id]
+
+    def _start_runners(self) -> None:
+        with self._lock:
+            while len(self._runners) < self.max_running:
+                t = threading.Thread(target=self._run_forever, name=f"export-runner-{len(self._runners)}", daemon=True)
+                t.start()
+                self._runners.append(t)
+
+    def _run_forever(self) -> None:
+        while True:
+            job = self._queue.get()
+            try:
+                job.run()
+            finally:
+                self._queue.task_done()
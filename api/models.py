@@ -1,11 +1,53 @@
-from pydantic import BaseModel, Field
+from typing import Literal
+
+from pydantic import BaseModel, Field, model_validator
 
 class GenerateSceneRequest(BaseModel):
     num_objects: int = Field(default=10, ge=1, le=200)
     seed: int = Field(default=42)
+    overlap: Literal["allow", "world", "screen"] = "allow"  # see scene/generator.py
+    max_attempts: int = Field(default=32, ge=1, le=1000)  # candidate positions per object when avoiding overlap
+
+class PointCloudOptions(BaseModel):
+    stride: int = Field(default=1, ge=1, le=64)  # keep every n-th pixel in both directions
+    voxel_size: float | None = Field(default=None, gt=0)  # one point per voxel of this edge length
+    max_points: int | None = Field(default=None, ge=1)  # fixed budget, sampled per instance
+    min_points_per_instance: int = Field(default=0, ge=0)
+
+class EncodingOptions(BaseModel):
+    depth_format: Literal["vis", "mm16", "npy", "npz"] = "vis"  # see render/encoding.py
+    png_compression: int | None = Field(default=None, ge=0, le=9)  # OpenCV IMWRITE_PNG_COMPRESSION
+
+Vec3 = tuple[float, float, float]
 
-class ExportDatasetRequest(BaseModel):
-    num_scenes: int = Field(default=20, ge=1, le=1000)
+class CameraPose(BaseModel):
+    position: Vec3 = (0.0, 0.0, 0.0)  # camera centre in world coordinates
+    rotation_rpy: Vec3 = (0.0, 0.0, 0.0)  # radians, see render/camera.py
+    look_at: Vec3 | None = None  # world point to aim at instead of rotation_rpy
+
+    @model_validator(mode="after")
+    def _check_look_at(self):
+        if self.look_at is not None and self.look_at == self.position:
+            raise ValueError("look_at must differ from position")
+        return self
+
+class RenderViewsRequest(BaseModel):
+    views: list[CameraPose] = Field(min_length=1, max_length=16)
+    modalities: str = "rgb,depth,semantic,instance,pointcloud"
+    format: Literal["zip", "npz"] = "zip"
+
+class StreamDatasetRequest(BaseModel):
+    num_scenes: int = Field(default=20, ge=1, le=1_000_000)
+    start: int = Field(default=0, ge=0)  # index of the first scene, to extend an existing dataset
     num_objects: int = Field(default=10, ge=1, le=200)
     seed: int = Field(default=0)
+    workers: int = Field(default=1, ge=1, le=64)
+    pointcloud: PointCloudOptions = Field(default_factory=PointCloudOptions)
+    encoding: EncodingOptions = Field(default_factory=EncodingOptions)
+    views: list[CameraPose] = Field(default_factory=list, max_length=64)  # render every scene from each pose, see dataset/export.py
+
+class ExportDatasetRequest(StreamDatasetRequest):
     out_dir: str = Field(default="dataset_out")
+    format: Literal["files", "shards", "memmap"] = "files"  # see dataset/export.py
+    shard_size: int = Field(default=1000, ge=1)  # scenes per shard
+    resume: bool = True  # files format: skip scenes already exported and verified, false starts out_dir over
@@ -10,185 +10,305 @@ GET  /scene/state       -- Return the current scene as JSON
 POST /scene/reset       -- Clear the current scene
 ```
 
+All scene, render and point cloud endpoints take an optional `?session=<id>` to work on an independent scene
+(see `sessions.py`); without it they use the default session.
+
 ### Rendering
 
 ```http
 GET /render/rgb         -- Return the RGB image (PNG)
-GET /render/depth       -- Return the depth image (PNG)
+GET /render/depth       -- Return the depth image (PNG, ?depth_format=vis|mm16|npy|npz)
 GET /render/semantic    -- Return the semantic mask (PNG)
 GET /render/instance    -- Return the instance mask (PNG)
+GET /render/bundle      -- Render once, return a subset of modalities as .zip (encoded files) or .npz (raw arrays)
+POST /render/views      -- Same as the bundle for several camera poses, one `v<k>/` folder (zip) or `v<k>_` key prefix (npz) per view
 ```
 
 ### Point Cloud
 
 ```http
-GET /pointcloud         -- Return the point cloud (PLY file)
+GET /pointcloud         -- Return the point cloud (PLY file), optionally decimated (stride, voxel_size, max_points, min_points_per_instance)
 ```
 
 ### Dataset Export
 
 ```http
-POST /dataset/export    -- Export a batch of scenes with all modalities
-``` """
+POST /dataset/export             -- Queue an export of a batch of scenes with all modalities, returns a job id
+POST /dataset/stream             -- Generate a batch of scenes on the fly and stream them as one .tar, no server disk
+GET  /dataset/jobs               -- List export jobs
+GET  /dataset/jobs/{id}          -- Job status: scenes done/total, throughput and ETA
+POST /dataset/jobs/{id}/cancel   -- Stop a queued or running export
+```
+
+### Monitoring
+
+```http
+GET /metrics            -- Prometheus text metrics: stage and request latency histograms, render/export counters and gauges
+```
+
+Any request sent with `X-Profile: 1` returns its per-stage time breakdown in a `Server-Timing` header
+(see `instrument.py`). """
 
 import io
-import os
-import json
+import posixpath
+import threading
+import weakref
+import zipfile
+from typing import Annotated
 
-import cv2
+import anyio
 import numpy as np
-from fastapi import FastAPI
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi import FastAPI, HTTPException, Query, Depends, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse, JSONResponse, Response
 
 from api.state import STATE
-from api.models import GenerateSceneRequest, ExportDatasetRequest
+from api.models import GenerateSceneRequest, ExportDatasetRequest, StreamDatasetRequest, PointCloudOptions, EncodingOptions
+from api.models import RenderViewsRequest
+from api.jobs import JobQueueFull
+from api.sessions import Session
+from api.instrument import MetricsMiddleware, app_gauges
 
+from scene.scene import Scene
 from scene.generator import generate_scene
-from render.renderer import render_scene
-from pointcloud.projection import depth_to_xyz
-from pointcloud.ply_export import build_labeled_pointcloud, save_ply
-
-from config import DEPTH_INF
+from render.cache import RenderQueueFull
+from render.encoding import EncodeSpec, DEPTH_FORMATS
+from pointcloud.projection import depth_to_points
+from dataset.export import stream_dataset
+from telemetry.metrics import exposition
+from telemetry.stages import stage
+from config import EXPORT_MAX_STREAMS
 
 app = FastAPI(title="Synthetic Data Backend")
-
-def _png_bytes_uint8(img: np.ndarray) -> bytes:
-    ok, buf = cv2.imencode(".png", img)
-    if not ok:
-        raise RuntimeError("PNG encoding failed")
-    return buf.tobytes()
-
-def _png_bytes_mask16(mask: np.ndarray) -> bytes:
-    mask16 = mask.astype(np.uint16)
-    ok, buf = cv2.imencode(".png", mask16)
-    if not ok:
-        raise RuntimeError("PNG encoding failed")
-    return buf.tobytes()
-
-def _png_bytes_depth_vis(depth: np.ndarray) -> bytes:
-    d = depth.copy()
-    d[d >= DEPTH_INF * 0.5] = np.nan  # background
-    mn = np.nanmin(d)
-    mx = np.nanmax(d)
-    vis = 255 * (d - mn) / (mx - mn + 1e-6)
-    vis = np.nan_to_num(vis, nan=255).astype(np.uint8)
-    ok, buf = cv2.imencode(".png", vis)
-    if not ok:
-        raise RuntimeError("PNG encoding failed")
-    return buf.tobytes()
-
-def _render():
-    return render_scene(STATE.scene, STATE.camera)
+app.add_middleware(MetricsMiddleware)
+app_gauges(STATE)
+
+_STREAMS = threading.BoundedSemaphore(EXPORT_MAX_STREAMS)
+
+def _session(session: str | None = Query(default=None, max_length=64, pattern="^[A-Za-z0-9_.-]+$")) -> Session:
+    return STATE.session(session)
+
+def _render(scene, camera=None):
+    try:
+        return STATE.offload.render(scene, camera or STATE.camera)
+    except RenderQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+def _encoded(scene, spec: EncodeSpec, camera=None) -> bytes:
+    # encoded bytes are cached next to the render, so repeated fetches skip both render and encode;
+    # identical requests in flight share one computation (render/offload.py)
+    try:
+        return STATE.offload.encoded(scene, camera or STATE.camera, spec)
+    except RenderQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+_BUNDLE_FILENAMES = {
+    "rgb": "rgb.png",
+    "depth": "depth.png",
+    "semantic": "semantic.png",
+    "instance": "instance.png",
+    "pointcloud": "cloud.ply",
+}
+
+def _parse_modalities(modalities: str) -> tuple:
+    names = tuple(dict.fromkeys(m.strip() for m in modalities.split(",") if m.strip()))
+    unknown = [m for m in names if m not in _BUNDLE_FILENAMES]
+    if not names or unknown:
+        raise HTTPException(status_code=400, detail=f"modalities must be a subset of {list(_BUNDLE_FILENAMES)}, got {unknown or 'none'}")
+    return names
+
+# with several cameras (/render/views) every view gets its own prefix, each view is rendered and cached on its own
+def _views(cameras):
+    return [("", STATE.camera)] if cameras is None else [(f"v{k:02d}", camera) for k, camera in enumerate(cameras)]
+
+def _bundle_zip(scene, names: tuple, cameras=None) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_STORED) as zf:  # png/ply are already compact
+        for prefix, camera in _views(cameras):
+            for m in names:
+                zf.writestr(posixpath.join(prefix, _BUNDLE_FILENAMES[m]), _encoded(scene, EncodeSpec(m), camera))
+    return buf.getvalue()
+
+def _bundle_npz(scene, names: tuple, cameras=None) -> bytes:
+    arrays = {}
+    for prefix, camera in _views(cameras):
+        out = _render(scene, camera)
+        view = {m: out[m] for m in names if m != "pointcloud"}
+        if "pointcloud" in names:
+            xyz, flat = depth_to_points(out["depth"], camera)
+            view["points_xyz"] = xyz
+            view["points_rgb"] = out["rgb"].reshape(-1, 3)[flat]
+            view["points_semantic"] = out["semantic"].reshape(-1)[flat]
+            view["points_instance"] = out["instance"].reshape(-1)[flat]
+        arrays.update({f"{prefix}_{name}" if prefix else name: arr for name, arr in view.items()})
+    buf = io.BytesIO()
+    np.savez(buf, **arrays)
+    return buf.getvalue()
 
 @app.post("/scene/generate")
-def generate_scene_api(req: GenerateSceneRequest):
-    STATE.scene = generate_scene(num_objects=req.num_objects, seed=req.seed)
-    return {"status": "ok", "num_objects": req.num_objects, "seed": req.seed}
+def generate_scene_api(req: GenerateSceneRequest, session: Session = Depends(_session)):
+    with stage("generate"):
+        scene = generate_scene(num_objects=req.num_objects, seed=req.seed, overlap=req.overlap,
+                               max_attempts=req.max_attempts, camera=STATE.camera)
+    session.replace(scene)  # generated outside the lock, renders of the old scene keep going meanwhile
+    # avoiding overlap can leave out objects that found no free spot
+    return {"status": "ok", "num_objects": len(scene), "seed": req.seed}
 
 @app.get("/scene/state")
-def get_scene_state():
-    return JSONResponse(STATE.scene.to_dict())
+def get_scene_state(session: Session = Depends(_session)):
+    with session.read() as scene, stage("scene_to_dict"):
+        state = scene.to_dict()
+    with stage("json_serialize"):
+        return JSONResponse(state)
 
 @app.post("/scene/reset")
-def reset_scene():
-    STATE.scene.reset()
+def reset_scene(session: Session = Depends(_session)):
+    session.replace(Scene())  # a fresh scene rather than reset() in place, so it is published to every worker
     return {"status": "ok"}
 
 @app.get("/render/rgb")
-def render_rgb():
-    out = _render()
-    png = _png_bytes_uint8(out["rgb"])
-    return StreamingResponse(io.BytesIO(png), media_type="image/png")
+def render_rgb(png_compression: int | None = Query(default=None, ge=0, le=9), session: Session = Depends(_session)):
+    with session.read() as scene:
+        png = _encoded(scene, EncodeSpec("rgb", png_compression))
+    return Response(png, media_type="image/png")
 
 @app.get("/render/depth")
-def render_depth():
-    out = _render()
-    png = _png_bytes_depth_vis(out["depth"])
-    return StreamingResponse(io.BytesIO(png), media_type="image/png")
+def render_depth(opts: Annotated[EncodingOptions, Query()], session: Session = Depends(_session)):
+    with session.read() as scene:
+        data = _encoded(scene, EncodeSpec("depth", opts.png_compression, opts.depth_format))
+    ext, media_type = DEPTH_FORMATS[opts.depth_format]
+    headers = {} if ext == ".png" else {"Content-Disposition": f'attachment; filename="depth{ext}"'}
+    return Response(data, media_type=media_type, headers=headers)
 
 @app.get("/render/semantic")
-def render_semantic():
-    out = _render()
-    png = _png_bytes_mask16(out["semantic"])
-    return StreamingResponse(io.BytesIO(png), media_type="image/png")
+def render_semantic(png_compression: int | None = Query(default=None, ge=0, le=9), session: Session = Depends(_session)):
+    with session.read() as scene:
+        png = _encoded(scene, EncodeSpec("semantic", png_compression))
+    return Response(png, media_type="image/png")
 
 @app.get("/render/instance")
-def render_instance():
-    out = _render()
-    png = _png_bytes_mask16(out["instance"])
-    return StreamingResponse(io.BytesIO(png), media_type="image/png")
+def render_instance(png_compression: int | None = Query(default=None, ge=0, le=9), session: Session = Depends(_session)):
+    with session.read() as scene:
+        png = _encoded(scene, EncodeSpec("instance", png_compression))
+    return Response(png, media_type="image/png")
 
 @app.get("/pointcloud")
-def pointcloud():
-    out = _render()
-    xyz, valid = depth_to_xyz(out["depth"], STATE.camera)
-    pcd = build_labeled_pointcloud(xyz, out["rgb"], out["semantic"], out["instance"], valid)
-
-    tmp_path = "tmp_cloud.ply"
-    save_ply(pcd, tmp_path)
-    with open(tmp_path, "rb") as f:
-        data = f.read()
-
-    return StreamingResponse(
-        io.BytesIO(data),
+def pointcloud(opts: Annotated[PointCloudOptions, Query()], session: Session = Depends(_session)):
+    with session.read() as scene:
+        # the default options map to the same spec as the bundle's point cloud
+        options = () if opts == PointCloudOptions() else tuple(opts.model_dump().items())
+        data = _encoded(scene, EncodeSpec("pointcloud", pointcloud=options))
+
+    return Response(
+        data,
         media_type="application/octet-stream",
         headers={"Content-Disposition": 'attachment; filename="cloud.ply"'},
     )
 
-@app.post("/dataset/export")
+@app.get("/render/bundle")
+def render_bundle(
+    modalities: str = Query(default="rgb,depth,semantic,instance,pointcloud"),
+    fmt: str = Query(default="zip", alias="format", pattern="^(zip|npz)$"),
+    session: Session = Depends(_session),
+):
+    names = _parse_modalities(modalities)
+    with session.read() as scene:  # every modality of the bundle from the same scene
+        if fmt == "zip":
+            data = _bundle_zip(scene, names)  # assembled from the per-modality cached encodings
+            media_type = "application/zip"
+        else:
+            data = _bundle_npz(scene, names)
+            media_type = "application/octet-stream"
+
+    return Response(
+        data,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="bundle.{fmt}"'},
+    )
+
+@app.post("/render/views")
+def render_views(req: RenderViewsRequest, session: Session = Depends(_session)):
+    names = _parse_modalities(req.modalities)
+    cameras = [STATE.camera.with_pose(**pose.model_dump()) for pose in req.views]
+    with session.read() as scene:
+        if req.format == "zip":
+            data = _bundle_zip(scene, names, cameras)
+            media_type = "application/zip"
+        else:
+            data = _bundle_npz(scene, names, cameras)
+            media_type = "application/octet-stream"
+
+    return Response(
+        data,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="views.{req.format}"'},
+    )
+
+@app.post("/dataset/export", status_code=202)
 def dataset_export(req: ExportDatasetRequest):
-    os.makedirs(req.out_dir, exist_ok=True)
-    index = []
-
-    for i in range(req.num_scenes):
-        seed_i = req.seed + i
-        scene = generate_scene(req.num_objects, seed=seed_i)
-        out = render_scene(scene, STATE.camera)
-
-        base = f"scene_{i:05d}"
-        rgb_path = os.path.join(req.out_dir, base + "_rgb.png")
-        depth_path = os.path.join(req.out_dir, base + "_depth.png")
-        sem_path = os.path.join(req.out_dir, base + "_semantic.png")
-        ins_path = os.path.join(req.out_dir, base + "_instance.png")
-        ply_path = os.path.join(req.out_dir, base + ".ply")
-        json_path = os.path.join(req.out_dir, base + ".json")
-
-        with open(rgb_path, "wb") as f: f.write(_png_bytes_uint8(out["rgb"]))
-        with open(depth_path, "wb") as f: f.write(_png_bytes_depth_vis(out["depth"]))
-        with open(sem_path, "wb") as f: f.write(_png_bytes_mask16(out["semantic"]))
-        with open(ins_path, "wb") as f: f.write(_png_bytes_mask16(out["instance"]))
-
-        xyz, valid = depth_to_xyz(out["depth"], STATE.camera)
-        pcd = build_labeled_pointcloud(xyz, out["rgb"], out["semantic"], out["instance"], valid)
-        save_ply(pcd, ply_path)
-
-        record = {
-            "id": base,
-            "seed": seed_i,
-            "scene": scene.to_dict(),
-            "camera": {
-                "width": STATE.camera.width,
-                "height": STATE.camera.height,
-                "fx": STATE.camera.fx,
-                "fy": STATE.camera.fy,
-                "cx": STATE.camera.cx,
-                "cy": STATE.camera.cy,
-            },
-            "files": {
-                "rgb": os.path.basename(rgb_path),
-                "depth": os.path.basename(depth_path),
-                "semantic": os.path.basename(sem_path),
-                "instance": os.path.basename(ins_path),
-                "pointcloud": os.path.basename(ply_path),
-            }
-        }
-
-        with open(json_path, "w", encoding="utf-8") as f:
-            json.dump(record, f, indent=2)
-
-        index.append(record)
-
-    with open(os.path.join(req.out_dir, "index.json"), "w", encoding="utf-8") as f:
-        json.dump(index, f, indent=2)
-
-    return {"status": "ok", "out_dir": req.out_dir, "num_scenes": req.num_scenes}
+    try:
+        job = STATE.jobs.submit(req, STATE.camera)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return {"status": "queued", "job_id": job.id, "out_dir": req.out_dir, "num_scenes": req.num_scenes}
+
+@app.post("/dataset/stream")
+async def dataset_stream(req: StreamDatasetRequest, request: Request):
+    if not _STREAMS.acquire(blocking=False):
+        raise HTTPException(status_code=429, detail=f"{EXPORT_MAX_STREAMS} dataset streams already running")
+
+    stream = stream_dataset(req, STATE.camera)
+    # released when the stream is closed, or garbage collected if the response never started
+    release = weakref.finalize(stream, _STREAMS.release)
+    lock = threading.Lock()  # a scene still being produced when the client leaves finishes before the close
+
+    def step():
+        with lock:
+            return next(stream, None)
+
+    def close():
+        with lock:
+            stream.close()  # cancels the scenes not started yet
+
+    async def body():
+        # scenes are produced in the threadpool; stop as soon as the client is gone instead of finishing the batch
+        try:
+            while not await request.is_disconnected():
+                chunk = await run_in_threadpool(step)
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            with anyio.CancelScope(shield=True):
+                await run_in_threadpool(close)
+            release()
+
+    return StreamingResponse(
+        body(),
+        media_type="application/x-tar",
+        headers={"Content-Disposition": 'attachment; filename="dataset.tar"'},
+    )
+
+@app.get("/metrics")
+def metrics():
+    return Response(exposition(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+def _get_job(job_id: str):
+    job = STATE.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"unknown job {job_id}")
+    return job
+
+@app.get("/dataset/jobs")
+def list_export_jobs():
+    return [job.to_dict() for job in STATE.jobs.list()]
+
+@app.get("/dataset/jobs/{job_id}")
+def get_export_job(job_id: str):
+    return _get_job(job_id).to_dict()
+
+@app.post("/dataset/jobs/{job_id}/cancel")
+def cancel_export_job(job_id: str):
+    job = _get_job(job_id)
+    job.cancel()
+    return job.to_dict()
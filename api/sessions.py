@@ -0,0 +1,136 @@
+""" Session-scoped scenes.
+
+Every `/scene/*`, `/render/*` and `/pointcloud` request takes an optional `?session=<id>`. Requests without one
+use the default session, which is the old global `STATE.scene` (and the shared store when `SHARED_STATE_DIR` is
+set). Named sessions are created on first use and kept in a `SessionRegistry` bounded by capacity (least
+recently used evicted first) and by idle time (TTL), so memory stays bounded however many clients come and go.
+With `SHARED_STATE_DIR` set every named session keeps its scene in its own shared store (`store_factory`), so all
+workers see it. Capacity and TTL then only bound the handles a worker keeps: every access touches the shared
+store, and a store is deleted (`sweep`) only once no worker used it for the TTL, whatever the local clocks say.
+
+Each session has its own read/write lock: a request holds the read side for its whole duration, so every
+modality it returns comes from the same scene, and generate/reset swap the scene under the write side. Sessions
+never wait on each other. """
+
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from scene.scene import Scene
+
+class RWLock:
+    """ Many readers or one writer. A waiting writer blocks new readers, so a stream of renders cannot starve a
+    generate. Not reentrant. """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+class Session:
+    def __init__(self, session_id: str, store=None):
+        self.id = session_id
+        self.lock = RWLock()
+        self.last_used = time.monotonic()
+        self._store = store  # SharedSceneStore or None
+        self._scene = Scene()
+
+    @property
+    def scene(self) -> Scene:
+        return self._scene if self._store is None else self._store.scene()
+
+    @scene.setter
+    def scene(self, scene: Scene) -> None:
+        if self._store is None:
+            self._scene = scene
+        else:
+            self._store.publish(scene)
+
+    @contextmanager
+    def read(self):
+        """ The session's scene, pinned until the block exits. """
+        with self.lock.read():
+            yield self.scene
+
+    def replace(self, scene: Scene) -> None:
+        with self.lock.write():
+            self.scene = scene
+
+    def touch(self) -> None:
+        if self._store is not None:
+            self._store.touch()
+
+class SessionRegistry:
+    def __init__(self, capacity: int = 64, ttl_sec: float = 1800.0, store_factory=None, sweep=None):
+        self.capacity = capacity
+        self.ttl_sec = ttl_sec
+        self._store_factory = store_factory  # session id -> SharedSceneStore, None keeps scenes in this process
+        self._sweep = sweep  # ttl_sec -> None, deletes the shared stores idle for longer, run at most once per TTL
+        self._next_sweep = time.monotonic() + ttl_sec
+        self._sessions = OrderedDict()  # least recently used first
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Session:
+        """ The session with this id, created if it does not exist (anymore). """
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                store = None if self._store_factory is None else self._store_factory(session_id)
+                session = Session(session_id, store=store)
+                self._sessions[session_id] = session
+            else:
+                self._sessions.move_to_end(session_id)
+            session.last_used = now
+            self._evict(now)
+            sweep = self._sweep is not None and now >= self._next_sweep
+            if sweep:
+                self._next_sweep = now + self.ttl_sec
+        session.touch()
+        if sweep:
+            self._sweep(self.ttl_sec)
+        return session
+
+    def _evict(self, now: float) -> None:
+        # caller holds the lock; requests still holding an evicted session finish with it undisturbed. Only the
+        # handle goes, a shared store stays for the other workers until the sweep finds it idle everywhere
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if len(self._sessions) <= self.capacity and now - oldest.last_used <= self.ttl_sec:
+                break
+            self._sessions.popitem(last=False)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
@@ -0,0 +1,205 @@
+""" Scene and render store shared by all uvicorn workers.
+
+`STATE` lives in one process, so with `uvicorn --workers N` a `POST /scene/generate` only reached the worker
+that served it and the others kept rendering their own (empty) scene. When `SHARED_STATE_DIR` is set, the
+current scene lives in that directory instead:
+
+* `current`                   -- version stamp of the current scene, atomically replaced on every publish
+* `scene_<stamp>.npz`         -- the scene columns (see `Scene.columns`)
+* `render_<stamp>_<camera>/`  -- rgb/depth/semantic/instance as .npy, memory-mapped read-only by every worker
+* `session_<id>/`             -- the same layout for every named session (`session_store`), minus the renders;
+                                 the directory's mtime is the session's last use by any worker (`touch`)
+
+Workers compare the stamp on every access and only reload the scene when it changed. The first worker to render
+a (scene, camera) pair writes the buffers; the others map them zero-copy instead of rasterizing again.
+Publishing removes the files of scenes older than the current one (a worker still mapping them keeps valid pages
+until it lets go). Stamps start with a nanosecond timestamp, so they sort in publish order. Publishers take an
+exclusive `flock` on `publish.lock` to compare and replace `current` and clean up, so a publish that lost the race
+never deletes the scene another worker just made current. Session directories are only deleted once none of
+the workers touched them for the session TTL (`remove_idle`, `remove_idle_sessions`).
+
+Put the directory on a local disk or tmpfs (`/dev/shm/...`), not on a network share. """
+
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+
+from scene.scene import Scene
+from render.renderer import render_scene
+
+_RENDER_ARRAYS = ("rgb", "depth", "semantic", "instance")
+
+def _new_stamp() -> str:
+    return f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+
+def _stamp_of(name: str) -> str | None:
+    if name.startswith("scene_") and name.endswith(".npz"):
+        return name[len("scene_"):-len(".npz")]
+    if name.startswith("render_"):
+        return name[len("render_"):].split("_")[0]
+    return None
+
+@contextmanager
+def _flock(path: str):
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def _remove_idle(root: str, ttl_sec: float) -> bool:
+    # every write into the directory (and every `touch`) moves its mtime, so checking it again under the publish
+    # lock keeps a publish or an access that came in meanwhile
+    try:
+        if time.time() - os.stat(root).st_mtime <= ttl_sec:
+            return False
+        with _flock(os.path.join(root, "publish.lock")):
+            if time.time() - os.stat(root).st_mtime <= ttl_sec:
+                return False
+            shutil.rmtree(root, ignore_errors=True)
+    except FileNotFoundError:  # removed by another worker
+        return False
+    return True
+
+class SharedSceneStore:
+    def __init__(self, root: str):
+        os.makedirs(root, exist_ok=True)
+        open(os.path.join(root, "publish.lock"), "a").close()  # created now, so locking it never moves the mtime
+        self.root = root
+        self._stamp = None  # stamp of the scene loaded in this process, None before anything was published
+        self._scene = Scene()
+        self._lock = threading.Lock()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def _current(self) -> str | None:
+        try:
+            with open(self._path("current"), encoding="ascii") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _replace(self, name: str, write) -> None:
+        # readers never see a half written file
+        tmp = self._path(f".tmp-{uuid.uuid4().hex}")
+        with open(tmp, "wb") as f:
+            write(f)
+        os.replace(tmp, self._path(name))
+
+    def _publish_lock(self):
+        return _flock(self._path("publish.lock"))
+
+    def publish(self, scene: Scene) -> str:
+        """ Make `scene` the current scene of every worker and return its stamp. """
+        stamp = _new_stamp()
+        os.makedirs(self.root, exist_ok=True)  # a session store may have been removed by another worker
+        cols = scene.columns()
+        names = np.frombuffer(json.dumps(cols.pop("names")).encode("utf-8"), dtype=np.uint8)
+        self._replace(f"scene_{stamp}.npz", lambda f: np.savez(f, names=names, **cols))
+
+        with self._publish_lock():
+            current = self._current()
+            if current is None or current < stamp:  # a newer scene published meanwhile wins
+                self._replace("current", lambda f: f.write(stamp.encode("ascii")))
+                current = stamp
+            self._remove_older(current)
+        with self._lock:
+            self._stamp, self._scene = stamp, scene
+        return stamp
+
+    def scene(self) -> Scene:
+        stamp = self._current()
+        with self._lock:
+            if stamp == self._stamp:
+                return self._scene
+
+        if stamp is None:  # nothing published, or the session expired
+            with self._lock:
+                self._stamp, self._scene = None, Scene()
+                return self._scene
+
+        try:
+            with np.load(self._path(f"scene_{stamp}.npz")) as data:
+                cols = {name: data[name] for name in data.files}
+        except FileNotFoundError:
+            # replaced and cleaned up by a newer publish between the two reads, the next access catches up
+            with self._lock:
+                return self._scene
+
+        names = json.loads(cols.pop("names").tobytes())
+        scene = Scene()
+        scene.add_columns(**cols, names=names)
+        with self._lock:
+            self._stamp, self._scene = stamp, scene
+        return scene
+
+    def render(self, scene, camera) -> dict:
+        """ `render_scene` for the current scene goes through the shared buffers, anything else renders locally. """
+        with self._lock:
+            stamp = self._stamp if scene is self._scene else None
+        if stamp is None:
+            return render_scene(scene, camera)
+
+        cam = hashlib.sha1(repr(camera.intrinsics() + camera.pose()).encode("ascii")).hexdigest()[:12]
+        path = self._path(f"render_{stamp}_{cam}")
+        out = None
+        if not os.path.isdir(path):
+            out = render_scene(scene, camera)
+            tmp = self._path(f".tmp-{uuid.uuid4().hex}")
+            os.makedirs(tmp)
+            for name in _RENDER_ARRAYS:
+                np.save(os.path.join(tmp, name + ".npy"), out[name])
+            try:
+                os.rename(tmp, path)
+            except OSError:  # another worker got there first
+                shutil.rmtree(tmp, ignore_errors=True)
+
+        try:
+            return {name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r") for name in _RENDER_ARRAYS}
+        except FileNotFoundError:  # scene replaced and its renders removed meanwhile
+            return out if out is not None else render_scene(scene, camera)
+
+    def session_store(self, session_id: str) -> "SharedSceneStore":
+        """ Store of a named session, in its own subdirectory. """
+        return SharedSceneStore(self._path(f"session_{session_id}"))
+
+    def touch(self) -> None:
+        """ Record a use of the store, seen by every worker. """
+        try:
+            os.utime(self.root)
+        except FileNotFoundError:  # expired, the next publish creates it again
+            pass
+
+    def remove_idle(self, ttl_sec: float) -> bool:
+        """ Delete the store's directory, for every worker, if nobody used it for `ttl_sec`. """
+        return _remove_idle(self.root, ttl_sec)
+
+    def remove_idle_sessions(self, ttl_sec: float) -> None:
+        """ `remove_idle` for every session store, including those no worker holds anymore. """
+        for name in os.listdir(self.root):
+            if name.startswith("session_"):
+                _remove_idle(self._path(name), ttl_sec)
+
+    def _remove_older(self, stamp: str) -> None:
+        for name in os.listdir(self.root):
+            old = _stamp_of(name)
+            if old is None or old >= stamp:
+                continue
+            path = self._path(name)
+            try:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+            except OSError:  # still open on platforms that refuse to delete open files, next publish retries
+                pass
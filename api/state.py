@@ -1,10 +1,38 @@
 from scene.scene import Scene
 from render.camera import PinholeCamera
-from config import IMG_W, IMG_H, FX, FY, CX, CY
+from render.cache import RenderCache
+from render.renderer import render_scene
+from render.offload import RenderOffload
+from api.jobs import JobManager
+from api.shared import SharedSceneStore
+from api.sessions import Session, SessionRegistry
+from config import IMG_W, IMG_H, FX, FY, CX, CY, RENDER_CACHE_ENTRIES, RENDER_CACHE_MAX_BYTES
+from config import EXPORT_MAX_QUEUED, EXPORT_MAX_RUNNING, SHARED_STATE_DIR, SESSION_CAPACITY, SESSION_TTL_SEC
+from config import RENDER_WORKERS, RENDER_MAX_PENDING
 
 class AppState:
-    def __init__(self):
-        self.scene = Scene()
+    def __init__(self, shared_dir: str | None = SHARED_STATE_DIR):
+        self.shared = SharedSceneStore(shared_dir) if shared_dir else None
+        self.default_session = Session("default", store=self.shared)
+        self.sessions = SessionRegistry(capacity=SESSION_CAPACITY, ttl_sec=SESSION_TTL_SEC,
+                                        store_factory=None if self.shared is None else self.shared.session_store,
+                                        sweep=None if self.shared is None else self.shared.remove_idle_sessions)
         self.camera = PinholeCamera(width=IMG_W, height=IMG_H, fx=FX, fy=FY, cx=CX, cy=CY)
+        self.render_cache = RenderCache(max_entries=RENDER_CACHE_ENTRIES, max_bytes=RENDER_CACHE_MAX_BYTES,
+                                        renderer=render_scene if self.shared is None else self.shared.render)
+        self.offload = RenderOffload(self.render_cache, workers=RENDER_WORKERS, max_pending=RENDER_MAX_PENDING)
+        self.jobs = JobManager(max_queued=EXPORT_MAX_QUEUED, max_running=EXPORT_MAX_RUNNING)
+
+    def session(self, session_id: str | None) -> Session:
+        return self.default_session if session_id is None else self.sessions.get(session_id)
+
+    # the default session's scene, with a shared store every worker sees the same one
+    @property
+    def scene(self) -> Scene:
+        return self.default_session.scene
+
+    @scene.setter
+    def scene(self, scene: Scene) -> None:
+        self.default_session.replace(scene)
 
 STATE = AppState()
@@ -0,0 +1,92 @@
+""" Timing, memory and baseline comparison for the benchmark suite (see `run.py`).
+
+A `Case` builds its inputs untimed (`make`), then its callable is run `warmup` times, timed `repeat` times with
+the garbage collector paused, and run once more under `tracemalloc` for the peak allocation. numpy reports its
+buffers to tracemalloc, so the peak covers arrays; memory held inside OpenCV is not seen. """
+
+import gc
+import math
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Callable
+
+import numpy as np
+
+@dataclass
+class Case:
+    name: str
+    group: str  # pipeline stage: generate, render, pointcloud, encode, export, api, ...
+    make: Callable  # () -> (fn, units): fn() is one timed call, units {"scenes": 1, "points": n, ...} per call
+    repeat: int = 5
+    params: dict = field(default_factory=dict)
+
+def _timings(fn, repeat: int, warmup: int) -> list[float]:
+    for _ in range(warmup):
+        fn()
+    gc_enabled = gc.isenabled()
+    gc.collect()
+    gc.disable()
+    try:
+        times = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - t0)
+        return times
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+def _peak_bytes(fn) -> int:
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def run_case(case: Case, repeat: int | None = None, warmup: int = 1) -> dict:
+    fn, units = case.make()
+    times = np.array(_timings(fn, repeat or case.repeat, warmup)) * 1e3
+    p50, p90, p99 = np.percentile(times, [50, 90, 99])
+    return {
+        "group": case.group,
+        "params": case.params,
+        "n": len(times),
+        "mean_ms": float(times.mean()),
+        "min_ms": float(times.min()),
+        "p50_ms": float(p50),
+        "p90_ms": float(p90),
+        "p99_ms": float(p99),
+        # at the median latency, so a single slow outlier does not skew it
+        "throughput": {f"{unit}_per_s": count / (p50 / 1e3) for unit, count in units.items()},
+        "peak_mb": _peak_bytes(fn) / 2**20,
+    }
+
+def compare(results: dict, baseline: dict, threshold: float = 0.15, memory_threshold: float = 0.25,
+            min_delta_ms: float = 0.5, min_delta_mb: float = 1.0) -> list[dict]:
+    """ One row per case present in both runs. A case regressed when its median latency grew by more than
+    `threshold` (relative) and `min_delta_ms`, or its peak memory by more than `memory_threshold` and
+    `min_delta_mb`; the absolute floors keep sub-millisecond jitter from failing the run. """
+    rows = []
+    for name, new in results["cases"].items():
+        old = baseline.get("cases", {}).get(name)
+        if old is None:
+            continue
+        time_ratio = new["p50_ms"] / old["p50_ms"] if old["p50_ms"] > 0 else math.inf
+        mem_ratio = new["peak_mb"] / old["peak_mb"] if old["peak_mb"] > 0 else math.inf
+        slower = time_ratio > 1 + threshold and new["p50_ms"] - old["p50_ms"] > min_delta_ms
+        bigger = mem_ratio > 1 + memory_threshold and new["peak_mb"] - old["peak_mb"] > min_delta_mb
+        rows.append({
+            "name": name,
+            "baseline_p50_ms": old["p50_ms"],
+            "p50_ms": new["p50_ms"],
+            "time_ratio": time_ratio,
+            "baseline_peak_mb": old["peak_mb"],
+            "peak_mb": new["peak_mb"],
+            "mem_ratio": mem_ratio,
+            "regressed": slower or bigger,
+        })
+    return rows
@@ -0,0 +1,261 @@
+""" Offline benchmark suite for the pipeline stages and the API.
+
+    python -m bench.run                                     # quick profile, results in bench_results.json
+    python -m bench.run --profile full --out bench/baseline.json
+    python -m bench.run --profile full --baseline bench/baseline.json --threshold 0.15
+
+Run from the repository root. Cases sweep object count, resolution and scene count (`PROFILES`):
+
+* `generate`   -- `generate_scene`, objects placed freely and with screen-space overlap avoidance
+* `to_dict`    -- `Scene.to_dict`, what `/scene/state` and every export record serialize
+* `render`     -- `render_scene` with both engines, per object count and resolution
+* `pointcloud` -- `depth_to_xyz`, `depth_to_points` + `build_labeled_pointcloud`, and `save_ply`
+* `encode`     -- the PNG encoders of `render/encoding.py` per modality
+* `annotate`   -- `instance_annotations` of a render and its JSON record block
+* `export`     -- `export_dataset` (files, shards, memmap) and `stream_dataset`, per scene count; with `--workers`
+  above 1 the peak memory only covers the parent process
+* `api`        -- endpoints through FastAPI's `TestClient`, render cache cold and warm
+
+Every case reports latency percentiles, throughput at the median (scenes/s, objects/s, pixels/s, points/s, as
+applicable) and peak allocation (see `harness.py`). Results are written as JSON with the machine and commit they
+ran on. With `--baseline` they are compared against an earlier results file and the run exits with status 1
+when any case regressed beyond the thresholds. Baselines only compare meaningfully on the same machine. """
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from functools import partial
+
+import cv2
+import numpy as np
+
+from config import IMG_W, FX
+from scene.generator import generate_scene
+from render.camera import PinholeCamera
+from render.renderer import render_scene
+from render.annotations import instance_annotations, annotations_json
+from render.encoding import png_bytes_uint8, png_bytes_mask16, png_bytes_depth_vis, png_bytes_depth_mm16
+from pointcloud.projection import depth_to_xyz, depth_to_points
+from pointcloud.ply_export import build_labeled_pointcloud, save_ply
+from dataset.export import export_dataset, stream_dataset
+from api.models import ExportDatasetRequest, StreamDatasetRequest
+from .harness import Case, run_case, compare
+
+RESOLUTIONS = {
+    "vga": (640, 480),
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+    "4k": (3840, 2160),
+}
+
+PROFILES = {
+    "quick": {"objects": (10, 200), "resolutions": ("vga",), "scenes": (10,), "repeat": 5},
+    "full": {"objects": (10, 200, 5000), "resolutions": ("vga", "720p", "1080p", "4k"), "scenes": (10, 100), "repeat": 10},
+}
+
+_STAGE_OBJECTS = 200  # objects in the scene behind the per-resolution stages
+
+def _camera(res: str) -> PinholeCamera:
+    w, h = RESOLUTIONS[res]
+    f = FX * w / IMG_W  # field of view of the config camera at every resolution
+    return PinholeCamera(width=w, height=h, fx=f, fy=f, cx=w / 2.0, cy=h / 2.0)
+
+def _rendered(res: str, num_objects: int = _STAGE_OBJECTS) -> tuple[PinholeCamera, dict]:
+    camera = _camera(res)
+    return camera, render_scene(generate_scene(num_objects, seed=0), camera)
+
+def _generate(num_objects: int, overlap: str):
+    return partial(generate_scene, num_objects, seed=0, overlap=overlap), {"scenes": 1, "objects": num_objects}
+
+def _to_dict(num_objects: int):
+    return generate_scene(num_objects, seed=0).to_dict, {"scenes": 1, "objects": num_objects}
+
+def _render(num_objects: int, res: str, engine: str):
+    camera = _camera(res)
+    scene = generate_scene(num_objects, seed=0)
+    return partial(render_scene, scene, camera, engine=engine), {"scenes": 1, "objects": num_objects, "pixels": camera.width * camera.height}
+
+def _depth_to_xyz(res: str):
+    camera, out = _rendered(res)
+    return partial(depth_to_xyz, out["depth"], camera), {"pixels": camera.width * camera.height}
+
+def _labeled_pointcloud(res: str):
+    camera, out = _rendered(res)
+
+    def run():
+        xyz, flat = depth_to_points(out["depth"], camera)
+        return build_labeled_pointcloud(xyz, out["rgb"], out["semantic"], out["instance"], flat)
+    return run, {"points": len(run())}
+
+def _save_ply(res: str, tmp: str):
+    camera, out = _rendered(res)
+    xyz, flat = depth_to_points(out["depth"], camera)
+    points = build_labeled_pointcloud(xyz, out["rgb"], out["semantic"], out["instance"], flat)
+    return partial(save_ply, points, os.path.join(tmp, f"bench_{res}.ply")), {"points": len(points)}
+
+_ENCODERS = {
+    "rgb": ("rgb", png_bytes_uint8),
+    "depth_vis": ("depth", png_bytes_depth_vis),
+    "depth_mm16": ("depth", png_bytes_depth_mm16),
+    "semantic": ("semantic", png_bytes_mask16),
+}
+
+def _encode(res: str, modality: str):
+    camera, out = _rendered(res)
+    key, encoder = _ENCODERS[modality]
+    return partial(encoder, out[key]), {"pixels": camera.width * camera.height}
+
+def _annotate(res: str):
+    camera, out = _rendered(res)
+    scene = generate_scene(_STAGE_OBJECTS, seed=0)
+
+    def run():
+        return annotations_json(instance_annotations(out, scene, camera))
+    return run, {"scenes": 1, "pixels": camera.width * camera.height}
+
+def _export(num_scenes: int, fmt: str, workers: int, tmp: str):
+    req = ExportDatasetRequest(out_dir=os.path.join(tmp, f"export_{fmt}_{num_scenes}"), num_scenes=num_scenes,
+                               format=fmt, workers=workers, resume=False)
+    camera = _camera("vga")
+    return partial(export_dataset, req, camera), {"scenes": num_scenes}
+
+def _stream(num_scenes: int, workers: int):
+    req = StreamDatasetRequest(num_scenes=num_scenes, workers=workers)
+    camera = _camera("vga")
+
+    def run():
+        return sum(len(chunk) for chunk in stream_dataset(req, camera))
+    return run, {"scenes": num_scenes}
+
+def _api(path: str, cold: bool):
+    # imported here: importing the server builds the app state, which the other cases do not need
+    from fastapi.testclient import TestClient
+    from api.server import app
+    from api.state import STATE
+
+    client = TestClient(app)
+    session = {"session": "bench"}
+    client.post("/scene/generate", params=session, json={"num_objects": _STAGE_OBJECTS, "seed": 0}).raise_for_status()
+
+    def run():
+        if cold:
+            STATE.render_cache.clear()
+        if path == "/scene/generate":
+            response = client.post(path, params=session, json={"num_objects": _STAGE_OBJECTS, "seed": 0})
+        else:
+            response = client.get(path, params=session)
+        response.raise_for_status()
+        return response
+    return run, {"requests": 1}
+
+def build_cases(profile: str, tmp: str, workers: int = 1) -> list[Case]:
+    p = PROFILES[profile]
+    repeat = p["repeat"]
+    cases = []
+    for n in p["objects"]:
+        for overlap in ("allow", "screen"):
+            cases.append(Case(f"generate/{overlap}/objects={n}", "generate", partial(_generate, n, overlap), repeat,
+                              {"objects": n, "overlap": overlap}))
+        cases.append(Case(f"to_dict/objects={n}", "to_dict", partial(_to_dict, n), repeat, {"objects": n}))
+    for res in p["resolutions"]:
+        for n in p["objects"]:
+            for engine in ("zbuffer", "tiled"):
+                cases.append(Case(f"render/{engine}/objects={n}/res={res}", "render", partial(_render, n, res, engine),
+                                  repeat, {"objects": n, "resolution": res, "engine": engine}))
+    for res in p["resolutions"]:
+        params = {"objects": _STAGE_OBJECTS, "resolution": res}
+        cases.append(Case(f"pointcloud/depth_to_xyz/res={res}", "pointcloud", partial(_depth_to_xyz, res), repeat, params))
+        cases.append(Case(f"pointcloud/labeled/res={res}", "pointcloud", partial(_labeled_pointcloud, res), repeat, params))
+        cases.append(Case(f"pointcloud/save_ply/res={res}", "pointcloud", partial(_save_ply, res, tmp), repeat, params))
+        for modality in _ENCODERS:
+            cases.append(Case(f"encode/{modality}/res={res}", "encode", partial(_encode, res, modality), repeat,
+                              {**params, "modality": modality}))
+        cases.append(Case(f"annotate/res={res}", "annotate", partial(_annotate, res), repeat, params))
+    for s in p["scenes"]:
+        for fmt in ("files", "shards", "memmap"):
+            cases.append(Case(f"export/{fmt}/scenes={s}", "export", partial(_export, s, fmt, workers, tmp), 3,
+                              {"scenes": s, "format": fmt, "workers": workers}))
+        cases.append(Case(f"export/stream/scenes={s}", "export", partial(_stream, s, workers), 3,
+                          {"scenes": s, "format": "stream", "workers": workers}))
+    for path, cold in (("/scene/generate", False), ("/scene/state", False), ("/render/rgb", True), ("/render/rgb", False),
+                       ("/render/bundle", True), ("/pointcloud", True)):
+        cases.append(Case(f"api{path}" + ("/cold" if cold else ""), "api", partial(_api, path, cold), repeat,
+                          {"path": path, "cold_cache": cold}))
+    return cases
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _meta(profile: str) -> dict:
+    return {
+        "profile": profile,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+def _print_case(name: str, r: dict) -> None:
+    rates = ", ".join(f"{v:,.0f} {k.replace('_per_s', '')}/s" for k, v in r["throughput"].items())
+    print(f"{name:<44} p50 {r['p50_ms']:9.2f} ms  p90 {r['p90_ms']:9.2f}  p99 {r['p99_ms']:9.2f}  "
+          f"peak {r['peak_mb']:8.1f} MB  {rates}", flush=True)
+
+def _print_comparison(rows: list[dict]) -> None:
+    for row in rows:
+        flag = "REGRESSED" if row["regressed"] else ""
+        print(f"{row['name']:<44} {row['baseline_p50_ms']:9.2f} -> {row['p50_ms']:9.2f} ms ({row['time_ratio']:5.2f}x)  "
+              f"{row['baseline_peak_mb']:8.1f} -> {row['peak_mb']:8.1f} MB ({row['mem_ratio']:5.2f}x)  {flag}")
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="quick")
+    parser.add_argument("--only", nargs="*", default=[], help="only cases whose name contains one of these")
+    parser.add_argument("--repeat", type=int, default=None, help="override the timed runs per case")
+    parser.add_argument("--workers", type=int, default=1, help="export worker processes")
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--baseline", default=None, help="results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed relative growth of the median latency")
+    parser.add_argument("--memory-threshold", type=float, default=0.25, help="allowed relative growth of peak memory")
+    args = parser.parse_args(argv)
+
+    results = {"meta": _meta(args.profile), "cases": {}}
+    with tempfile.TemporaryDirectory(prefix="bench_") as tmp:
+        for case in build_cases(args.profile, tmp, args.workers):
+            if args.only and not any(s in case.name for s in args.only):
+                continue
+            r = run_case(case, args.repeat)
+            results["cases"][case.name] = r
+            _print_case(case.name, r)
+    # ru_maxrss is in KiB on Linux
+    results["meta"]["max_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"results written to {args.out}")
+
+    if args.baseline is None:
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    rows = compare(results, baseline, args.threshold, args.memory_threshold)
+    _print_comparison(rows)
+    regressed = [row["name"] for row in rows if row["regressed"]]
+    if regressed:
+        print(f"{len(regressed)} case(s) regressed against {args.baseline}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,5 @@
+import os
+
 IMG_W = 640 #hole image size 
 IMG_H = 480
 
@@ -12,4 +14,21 @@ X_RANGE = (-2.0, 2.0) #hole el ranges yali 3arafnehon abl
 Y_RANGE = (-2.0, 2.0)
 Z_RANGE = (3.0, 8.0)
 
-SIZE_K = 220.0 #screen size scaling
\ No newline at end of file
+SIZE_K = 220.0 #screen size scaling
+
+STAMP_CACHE_SIZE = 1024 #cached shape masks per (shape, rx, ry)
+RENDER_ENGINE = "zbuffer" #or "tiled": front-to-back painter with per-tile culling, same output, faster for thousands of objects
+
+RENDER_CACHE_ENTRIES = 8 #how many rendered scenes (per camera) we keep around
+RENDER_CACHE_MAX_BYTES = 256 * 1024 * 1024
+RENDER_WORKERS = 0 #processes for render/encode work of the API, 0 keeps it in the request thread
+RENDER_MAX_PENDING = 32 #distinct renders in flight before the API answers 503
+
+EXPORT_MAX_QUEUED = 4 #export jobs waiting on top of the running ones, more than that get rejected
+EXPORT_MAX_RUNNING = 1
+EXPORT_MAX_STREAMS = 2 #concurrent /dataset/stream responses
+
+SESSION_CAPACITY = 64 #named scene sessions kept per worker, least recently used dropped first
+SESSION_TTL_SEC = 30 * 60 #sessions idle longer than this are dropped
+
+SHARED_STATE_DIR = os.environ.get("SHARED_STATE_DIR") #e.g. /dev/shm/synth, shares the scene and renders between uvicorn workers
\ No newline at end of file
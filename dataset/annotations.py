@@ -0,0 +1,147 @@
+""" Columnar summary of the annotations of an export.
+
+Every record carries an `annotations` block (per-instance boxes, areas and visibility plus its class histogram,
+see `render/annotations.py`). Exports also gather them into one `annotations.npz` next to the index, so dataset
+statistics (class balance, occlusion, box sizes) are a few array operations instead of a parse of every record:
+
+* `record_id` (R,) -- the records, in index order
+* `instance_offsets` int64 (R + 1,) -- instances of record r are rows `offsets[r]:offsets[r + 1]` of
+* `instance_id`, `class_id` int32 (M,), `bbox` int32 (M, 4) (-1 when not visible), `area`, `footprint` int32 (M,),
+  `visibility` float32 (M,)
+* `class_pixels` int64 (R, C) -- semantic histogram per record, column = class id, 0 is background
+
+Records without annotations (exported before records had them) are left out. Rows are appended to fixed-dtype
+spool files as the records go by (kept in memory up to 1 MiB each, then moved to `spool_dir`), and the `.npz` is
+written column by column in chunks, so memory stays flat however many records an export has. """
+
+import io
+import itertools
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+
+ANNOTATIONS_NAME = "annotations.npz"
+
+_INSTANCE = np.dtype([("instance_id", np.int32), ("class_id", np.int32), ("bbox", np.int32, (4,)),
+                      ("area", np.int32), ("footprint", np.int32), ("visibility", np.float32)])
+_RECORD = np.dtype([("instances", np.int64), ("classes", np.int64)])
+_CLASS = np.dtype([("class_id", np.int64), ("pixels", np.int64)])
+
+_NO_BOX = (-1, -1, -1, -1)
+_SPOOL_MEMORY = 1 << 20
+_CHUNK = 1 << 16  # rows per read while writing the .npz
+
+def _read(spool, dtype: np.dtype):
+    """ The rows of a spool file, in chunks. """
+    spool.seek(0)
+    while True:
+        data = spool.read(_CHUNK * dtype.itemsize)
+        if not data:
+            return
+        yield np.frombuffer(data, dtype=dtype)
+
+def _write_column(zf: zipfile.ZipFile, name: str, dtype: np.dtype, shape: tuple, chunks) -> None:
+    with zf.open(name + ".npy", "w", force_zip64=True) as member:
+        header = {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": shape}
+        np.lib.format.write_array_header_1_0(member, header)
+        for chunk in chunks:
+            member.write(np.ascontiguousarray(chunk, dtype=dtype).tobytes())
+
+class AnnotationSummary:
+    def __init__(self, spool_dir: str | None = None):
+        def spool():
+            return tempfile.SpooledTemporaryFile(max_size=_SPOOL_MEMORY, dir=spool_dir)
+        self._ids = spool()  # utf-8 record ids, one per line
+        self._records = spool()
+        self._instances = spool()
+        self._classes = spool()
+        self._num_records = 0
+        self._num_instances = 0
+        self._id_length = 1
+        self._num_classes = 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self) -> int:
+        return self._num_records
+
+    def add(self, record: dict) -> None:
+        ann = record.get("annotations")
+        if ann is None:
+            return
+        rows = np.array([(o["instance_id"], o["class_id"], o["bbox"] or _NO_BOX, o["area"], o["footprint"], o["visibility"])
+                         for o in ann["instances"]], dtype=_INSTANCE)
+        classes = np.array([(int(c), p) for c, p in ann["class_pixels"].items()], dtype=_CLASS)
+
+        self._ids.write(record["id"].encode("utf-8") + b"\n")
+        self._records.write(np.array([(len(rows), len(classes))], dtype=_RECORD).tobytes())
+        self._instances.write(rows.tobytes())
+        self._classes.write(classes.tobytes())
+        self._num_records += 1
+        self._num_instances += len(rows)
+        self._id_length = max(self._id_length, len(record["id"]))
+        if len(classes):
+            self._num_classes = max(self._num_classes, int(classes["class_id"].max()) + 1)
+
+    def _id_chunks(self):
+        self._ids.seek(0)
+        lines = iter(self._ids.readline, b"")
+        while chunk := list(itertools.islice(lines, _CHUNK)):
+            yield np.array([line[:-1].decode("utf-8") for line in chunk])
+
+    def _offset_chunks(self):
+        yield np.zeros(1, dtype=np.int64)
+        total = 0
+        for records in _read(self._records, _RECORD):
+            offsets = total + np.cumsum(records["instances"])
+            total = int(offsets[-1])
+            yield offsets
+
+    def _class_pixel_chunks(self):
+        self._classes.seek(0)
+        for records in _read(self._records, _RECORD):
+            counts = records["classes"]
+            classes = np.frombuffer(self._classes.read(int(counts.sum()) * _CLASS.itemsize), dtype=_CLASS)
+            block = np.zeros((len(records), self._num_classes), dtype=np.int64)
+            block[np.repeat(np.arange(len(records)), counts), classes["class_id"]] = classes["pixels"]
+            yield block
+
+    def write(self, f) -> None:
+        """ Write the summary as an .npz into the binary file `f`. """
+        R, M = self._num_records, self._num_instances
+        try:
+            with zipfile.ZipFile(f, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+                _write_column(zf, "record_id", np.dtype(f"U{self._id_length}"), (R,), self._id_chunks())
+                _write_column(zf, "instance_offsets", np.dtype(np.int64), (R + 1,), self._offset_chunks())
+                for name in _INSTANCE.names:
+                    field = _INSTANCE.fields[name][0]
+                    _write_column(zf, name, field.base, (M,) + field.shape,
+                                  (rows[name] for rows in _read(self._instances, _INSTANCE)))
+                _write_column(zf, "class_pixels", np.dtype(np.int64), (R, self._num_classes), self._class_pixel_chunks())
+        finally:
+            for spool in (self._ids, self._records, self._instances, self._classes):
+                spool.seek(0, os.SEEK_END)  # further records append
+
+    def to_bytes(self) -> bytes:
+        buf = io.BytesIO()
+        self.write(buf)
+        return buf.getvalue()
+
+    def save(self, out_dir: str) -> None:
+        with open(os.path.join(out_dir, ANNOTATIONS_NAME), "wb") as f:
+            self.write(f)
+
+    def close(self) -> None:
+        for spool in (self._ids, self._records, self._instances, self._classes):
+            spool.close()
+
+def load_annotations(root: str) -> dict:
+    """ The columns of the `annotations.npz` of an export directory, as {name: array}. """
+    with np.load(os.path.join(root, ANNOTATIONS_NAME)) as npz:
+        return dict(npz)
@@ -0,0 +1,322 @@
+""" Dataset export: generate, render and write a batch of scenes with all modalities.
+
+Every scene is fully determined by `seed + i`, so scenes are independent and can be spread over a
+process pool. The parent consumes results in scene order, so the output is byte-identical to the
+sequential path. Two output formats:
+
+* `files`  -- six files per scene plus an `index.jsonl` appended as scenes complete; workers write their own files
+* `shards` -- fixed-size tar shards plus an `index.jsonl` written as scenes complete (see `shards.py`);
+  workers only encode, the parent appends to the current shard
+* `memmap` -- raw fixed-shape arrays for memory-mapped training loads (see `reader.py`), nothing encoded
+
+`stream_dataset` writes the `files` layout into a tar stream instead of a directory (`POST /dataset/stream`):
+nothing touches the server's disk and only the scenes in flight are held in memory.
+
+`files` exports are resumable and extendable. Outputs are deterministic in the scene index and the export
+parameters, so every index line records a hash of those parameters (`params`) and the sha256 of each file the
+scene wrote. Rerunning an export into the same `out_dir` skips scenes whose files are all present and verify,
+re-exports the rest and only appends lines for scenes the index does not list yet. `start` offsets the scene
+indices, e.g. `start=1000, num_scenes=1000` extends a dataset of scenes 0-999. An index written with different
+parameters is refused rather than mixed into.
+
+Multi-view: with `views` (camera poses) every scene is generated once and rendered from each pose, projecting
+the objects into all views in one batch (`render_views`). Each view is a record of its own, with the id
+`<scene id>_v<k>` plus `scene_id` and `view` fields and its posed camera, so all formats take views unchanged.
+Point clouds are in the camera frame of their view.
+
+Annotations: every record has an `annotations` block with each object's instance and class id, visible `bbox`
+and `area`, unoccluded `footprint` and `visibility` (area / footprint), plus the view's `class_pixels` histogram
+and visible `class_instances` count per class, computed from the render in the same worker. Every export format
+also writes them as one columnar `annotations.npz` for the whole export (see `annotations.py`). A stream cannot
+hold a whole-export file back until its end, so `stream_dataset` sends the same columns per scene instead. """
+
+import io
+import os
+import json
+import hashlib
+import itertools
+import tarfile
+from collections import deque
+from functools import partial
+
+from scene.generator import generate_scene
+from render.renderer import render_views
+from render.annotations import instance_annotations, annotations_json
+from render.offload import process_pool
+from render.encoding import png_bytes_uint8, png_bytes_mask16, encode_depth, DEPTH_FORMATS
+from pointcloud.projection import labeled_points
+from pointcloud.ply_export import ply_bytes
+from .shards import ShardWriter, add_member
+from .reader import MemmapWriter
+from .annotations import AnnotationSummary
+from telemetry.stages import EXPORT_SCENES
+
+def _camera_dict(camera) -> dict:
+    d = {
+        "width": camera.width,
+        "height": camera.height,
+        "fx": camera.fx,
+        "fy": camera.fy,
+        "cx": camera.cx,
+        "cy": camera.cy,
+    }
+    if any(camera.pose()):
+        d["position"] = list(camera.position)
+        d["rotation_rpy"] = list(camera.rotation_rpy)
+    return d
+
+def scene_id(i: int) -> str:
+    return f"scene_{i:05d}"
+
+def view_id(i: int, k: int) -> str:
+    return f"{scene_id(i)}_v{k:02d}"
+
+def _record_ids(i: int, views) -> list[str]:
+    return [scene_id(i)] if views is None else [view_id(i, k) for k in range(len(views))]
+
+def view_cameras(req, camera) -> tuple | None:
+    """ `camera` at every pose of `req.views`, None without views. """
+    return tuple(camera.with_pose(**pose.model_dump()) for pose in req.views) or None
+
+def params_key(req, camera) -> str:
+    """ Hash of every export parameter that decides a scene's outputs, besides its index. """
+    params = {
+        "seed": req.seed,
+        "num_objects": req.num_objects,
+        "camera": _camera_dict(camera),
+        "pointcloud": req.pointcloud.model_dump(),
+        "encoding": req.encoding.model_dump(),
+    }
+    if req.views:
+        params["views"] = [_camera_dict(view) for view in view_cameras(req, camera)]
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+def render_views_arrays(i: int, seed: int, num_objects: int, camera, pointcloud=None,
+                        views=None) -> list[tuple[dict, dict]]:
+    """ Generate scene `i` once and render it with `camera`, or from every camera in `views`. Returns a record
+    (without files, with annotations) and the raw arrays per view: rgb, depth, semantic, instance and the
+    labeled `points`. """
+    seed_i = seed + i
+    scene = generate_scene(num_objects, seed=seed_i)
+    cameras = [camera] if views is None else list(views)
+    scene_dict = scene.to_dict()
+
+    results = []
+    for k, (cam, out) in enumerate(zip(cameras, render_views(scene, cameras))):
+        points = labeled_points(out, cam, **({} if pointcloud is None else pointcloud.model_dump()))
+        record = {"id": scene_id(i)}
+        if views is not None:
+            record = {"id": view_id(i, k), "scene_id": scene_id(i), "view": k}
+        record.update(seed=seed_i, scene=scene_dict, camera=_camera_dict(cam))
+        record["annotations"] = annotations_json(instance_annotations(out, scene, cam))
+        results.append((record, {**out, "points": points}))
+    return results
+
+def encode_views(i: int, seed: int, num_objects: int, camera, pointcloud=None, encoding=None,
+                 views=None) -> list[tuple[dict, dict]]:
+    """ Generate, render and encode scene `i`. Returns a record and the encoded files {file name: bytes} per view. """
+    return [_encode(record, arrays, encoding)
+            for record, arrays in render_views_arrays(i, seed, num_objects, camera, pointcloud, views=views)]
+
+def _encode(record: dict, arrays: dict, encoding) -> tuple[dict, dict]:
+    depth_format = "vis" if encoding is None else encoding.depth_format
+    level = None if encoding is None else encoding.png_compression
+
+    base = record["id"]
+    names = {
+        "rgb": base + "_rgb.png",
+        "depth": base + "_depth" + DEPTH_FORMATS[depth_format][0],
+        "semantic": base + "_semantic.png",
+        "instance": base + "_instance.png",
+        "pointcloud": base + ".ply",
+    }
+    files = {
+        names["rgb"]: png_bytes_uint8(arrays["rgb"], level),
+        names["depth"]: encode_depth(arrays["depth"], depth_format, level),
+        names["semantic"]: png_bytes_mask16(arrays["semantic"], level),
+        names["instance"]: png_bytes_mask16(arrays["instance"], level),
+        names["pointcloud"]: ply_bytes(arrays["points"]),
+    }
+
+    record["files"] = names
+    record["num_points"] = len(arrays["points"])
+    record["depth_format"] = depth_format
+    return record, files
+
+def export_views(i: int, seed: int, num_objects: int, camera, out_dir: str, pointcloud=None, encoding=None,
+                 views=None) -> list[dict]:
+    records = []
+    for record, files in encode_views(i, seed, num_objects, camera, pointcloud, encoding, views):
+        files[record["id"] + ".json"] = json.dumps(record, indent=2).encode("utf-8")
+
+        for name, data in files.items():
+            with open(os.path.join(out_dir, name), "wb") as f:
+                f.write(data)
+
+        record["sha256"] = {name: hashlib.sha256(data).hexdigest() for name, data in files.items()}
+        records.append(record)
+    return records
+
+def _load_index(out_dir: str, params: str, summary=None) -> dict:
+    """ {scene id: {file name: sha256}} of the scenes an earlier `files` export listed in `out_dir`.
+    Their annotations go into `summary`, in index order. """
+    path = os.path.join(out_dir, "index.jsonl")
+    if not os.path.exists(path):
+        return {}
+
+    hashes = {}
+    complete = 0
+    with open(path, "rb+") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break  # torn last line of an interrupted export, that scene is simply exported again
+            entry = json.loads(line)
+            if entry.get("params") != params:
+                raise ValueError(f"{out_dir} holds scenes exported with different parameters, "
+                                 "use another out_dir or resume=false")
+            hashes[entry["id"]] = entry["sha256"]
+            if summary is not None:
+                summary.add(entry)
+            complete += len(line)
+        f.truncate(complete)
+    return hashes
+
+def _verified(out_dir: str, hashes: dict) -> bool:
+    for name, digest in hashes.items():
+        try:
+            with open(os.path.join(out_dir, name), "rb") as f:
+                if hashlib.file_digest(f, "sha256").hexdigest() != digest:
+                    return False
+        except FileNotFoundError:
+            return False
+    return True
+
+def _results(work, indices, workers: int):
+    """ Yield `work(i)` for every scene index, in order. With several workers at most `2 * workers` scenes are
+    in flight, so memory stays flat however slowly the results are consumed. Closing the generator early
+    cancels the scenes not started yet. """
+    workers = min(workers, len(indices))
+    if workers <= 1:
+        for i in indices:
+            yield work(i)
+        return
+
+    pool = process_pool(workers)  # the API server runs exports from a thread
+    try:
+        todo = iter(indices)
+        pending = deque(pool.submit(work, i) for i in itertools.islice(todo, 2 * workers))
+        while pending:
+            result = pending.popleft().result()
+            i = next(todo, None)
+            if i is not None:
+                pending.append(pool.submit(work, i))
+            yield result
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def _run(work, indices, workers: int, sink, on_scene=None, should_stop=None) -> int:
+    """ Hand every `work(i)` result to `sink`, in scene order. Returns scenes done. """
+    done = 0
+    results = _results(work, indices, workers)
+    try:
+        for result in results:
+            sink(result)
+            done += 1
+            EXPORT_SCENES.inc()
+            if on_scene is not None:
+                on_scene(done)
+            if should_stop is not None and should_stop():
+                break
+    finally:
+        results.close()
+    return done
+
+def _add_views(writer, summary):
+    def add(results):
+        for record, data in results:
+            writer.add(record, data)
+            summary.add(record)
+    return add
+
+def export_dataset(req, camera, on_scene=None, should_stop=None) -> int:
+    """ Export scenes `req.start` .. `req.start + req.num_scenes - 1` into `req.out_dir` in `req.format` and
+    return how many of them are on disk afterwards (for `files`, including scenes skipped as already exported).
+    `on_scene(done)` is called after every finished scene. When `should_stop()` turns true the export stops
+    early and the index only lists the scenes finished so far, in order. """
+    os.makedirs(req.out_dir, exist_ok=True)
+    with AnnotationSummary(spool_dir=req.out_dir) as summary:
+        done = _export(req, camera, summary, on_scene, should_stop)
+        summary.save(req.out_dir)
+    return done
+
+def _export(req, camera, summary, on_scene, should_stop) -> int:
+    views = view_cameras(req, camera)
+    render_options = dict(seed=req.seed, num_objects=req.num_objects, camera=camera, pointcloud=req.pointcloud,
+                          views=views)
+    options = dict(render_options, encoding=req.encoding)
+    scenes = range(req.start, req.start + req.num_scenes)
+
+    if req.format == "shards":
+        with ShardWriter(req.out_dir, req.shard_size) as writer:
+            return _run(partial(encode_views, **options), scenes, req.workers,
+                        _add_views(writer, summary), on_scene, should_stop)
+
+    if req.format == "memmap":
+        rows = req.num_scenes * (1 if views is None else len(views))
+        with MemmapWriter(req.out_dir, rows, camera.height, camera.width) as writer:
+            return _run(partial(render_views_arrays, **render_options), scenes, req.workers,
+                        _add_views(writer, summary), on_scene, should_stop)
+
+    params = params_key(req, camera)
+    listed = _load_index(req.out_dir, params, summary) if req.resume else {}
+    todo = [i for i in scenes
+            if not all(rid in listed and _verified(req.out_dir, listed[rid]) for rid in _record_ids(i, views))]
+    skipped = len(scenes) - len(todo)
+    if on_scene is not None and skipped:
+        on_scene(skipped)
+
+    with open(os.path.join(req.out_dir, "index.jsonl"), "a" if req.resume else "w", encoding="utf-8") as index:
+        def append(records):
+            # a listed scene that failed verification was rewritten with the same bytes, its line still holds
+            for record in records:
+                if record["id"] not in listed:
+                    index.write(json.dumps({**record, "params": params}) + "\n")
+                    summary.add(record)
+            index.flush()
+
+        done = _run(partial(export_views, out_dir=req.out_dir, **options), todo, req.workers, append,
+                    None if on_scene is None else lambda n: on_scene(skipped + n), should_stop)
+
+    return skipped + done
+
+def _drain(buf: io.BytesIO) -> bytes:
+    data = buf.getvalue()
+    buf.seek(0)
+    buf.truncate()
+    return data
+
+def stream_dataset(req, camera):
+    """ Yield a tar archive of scenes `req.start` .. `req.start + req.num_scenes - 1`, one chunk per finished scene.
+    Members are named as in a `files` export: the modality files and `<id>.json` of every scene (view), in order,
+    then `<scene id>_annotations.npz` with the annotation columns of the scene's records. """
+    options = dict(seed=req.seed, num_objects=req.num_objects, camera=camera, pointcloud=req.pointcloud,
+                   encoding=req.encoding, views=view_cameras(req, camera))
+    buf = io.BytesIO()
+    tar = tarfile.open(fileobj=buf, mode="w|", format=tarfile.PAX_FORMAT)
+    results = _results(partial(encode_views, **options), range(req.start, req.start + req.num_scenes), req.workers)
+    try:
+        for views in results:
+            with AnnotationSummary() as summary:
+                for record, files in views:
+                    for name, data in files.items():
+                        add_member(tar, name, data)
+                    add_member(tar, record["id"] + ".json", json.dumps(record, indent=2).encode("utf-8"))
+                    summary.add(record)
+                scene = views[0][0].get("scene_id", views[0][0]["id"])
+                add_member(tar, f"{scene}_annotations.npz", summary.to_bytes())
+            EXPORT_SCENES.inc()
+            yield _drain(buf)
+        tar.close()
+        yield _drain(buf)
+    finally:
+        results.close()
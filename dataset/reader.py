@@ -0,0 +1,179 @@
+""" Memory-mapped dataset reader.
+
+Decoding PNGs and parsing PLYs per sample is wasted work for training loads. The memmap layout keeps every
+modality as one fixed-shape array on disk, so a sample is a slice and `__getitem__` is O(1) and zero-copy.
+Several training worker processes opening the same directory share the OS page cache instead of each
+decoding its own images.
+
+Layout of a memmap dataset directory:
+
+* `rgb.npy` uint8 (N, H, W, 3), `depth.npy` float32 (N, H, W) metric camera z (background `DEPTH_INF`),
+  `semantic.npy` / `instance.npy` int32 (N, H, W)
+* `points.bin` -- all point clouds back to back as raw `PLY_DTYPE` records
+* `point_offsets.npy` int64 (N + 1,) -- points of scene i are `points[offsets[i]:offsets[i + 1]]`
+* `records.jsonl` -- the scene records, one per line
+* `meta.json` -- number of scenes and image shape
+* `annotations.npz` -- the records' annotations as columns (see `annotations.py`)
+
+Write it directly with `ExportDatasetRequest(format="memmap")`, or convert an existing `files` / `shards`
+export with `convert_to_memmap` (its depth must have been exported as mm16, npy or npz, `vis` is not metric). """
+
+import io
+import json
+import os
+
+import cv2
+import numpy as np
+
+from config import DEPTH_INF
+from pointcloud.ply_export import PLY_DTYPE, ply_from_bytes
+from .shards import iter_index, read_member
+from .annotations import AnnotationSummary
+
+_IMAGES = {
+    "rgb": (np.uint8, (3,)),
+    "depth": (np.float32, ()),
+    "semantic": (np.int32, ()),
+    "instance": (np.int32, ()),
+}
+
+class MemmapWriter:
+    def __init__(self, out_dir: str, num_scenes: int, height: int, width: int):
+        os.makedirs(out_dir, exist_ok=True)
+        self.out_dir = out_dir
+        self.height = height
+        self.width = width
+        self._arrays = {
+            name: np.lib.format.open_memmap(os.path.join(out_dir, name + ".npy"), mode="w+", dtype=dtype,
+                                            shape=(num_scenes, height, width) + tail)
+            for name, (dtype, tail) in _IMAGES.items()
+        }
+        self._points = open(os.path.join(out_dir, "points.bin"), "wb")
+        self._records = open(os.path.join(out_dir, "records.jsonl"), "w", encoding="utf-8")
+        self._offsets = [0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, record: dict, arrays: dict) -> None:
+        i = len(self._offsets) - 1
+        for name, arr in self._arrays.items():
+            if arrays[name].shape != arr.shape[1:]:
+                raise ValueError(f"{name} has shape {arrays[name].shape}, dataset expects {arr.shape[1:]}")
+            arr[i] = arrays[name]
+
+        points = np.ascontiguousarray(arrays["points"], dtype=PLY_DTYPE)
+        self._points.write(memoryview(points).cast("B"))
+        self._offsets.append(self._offsets[-1] + len(points))
+        self._records.write(json.dumps(record) + "\n")
+
+    def close(self) -> None:
+        if self._points.closed:
+            return
+        for arr in self._arrays.values():
+            arr.flush()
+        self._points.close()
+        self._records.close()
+        np.save(os.path.join(self.out_dir, "point_offsets.npy"), np.asarray(self._offsets, dtype=np.int64))
+        meta = {"num_scenes": len(self._offsets) - 1, "height": self.height, "width": self.width}
+        with open(os.path.join(self.out_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+
+class MemmapDataset:
+    """ Random access over a memmap dataset directory. `ds[i]` returns read-only views, no data is copied. """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._open()
+
+    def _open(self) -> None:
+        with open(os.path.join(self.root, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        n = meta["num_scenes"]
+        # arrays may be longer than num_scenes when an export was cancelled
+        self._arrays = {name: np.load(os.path.join(self.root, name + ".npy"), mmap_mode="r")[:n] for name in _IMAGES}
+        self.rgb, self.depth, self.semantic, self.instance = (self._arrays[name] for name in _IMAGES)
+        self.offsets = np.load(os.path.join(self.root, "point_offsets.npy"))
+        path = os.path.join(self.root, "points.bin")
+        # np.memmap refuses empty files
+        self.points = np.memmap(path, dtype=PLY_DTYPE, mode="r") if os.path.getsize(path) else np.empty(0, dtype=PLY_DTYPE)
+        self.height = meta["height"]
+        self.width = meta["width"]
+
+    # memmaps would be pickled by value; ship the path and reopen in the worker instead
+    def __getstate__(self):
+        return {"root": self.root}
+
+    def __setstate__(self, state):
+        self.root = state["root"]
+        self._open()
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> dict:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        sample = {name: arr[i] for name, arr in self._arrays.items()}
+        sample["points"] = self.points[self.offsets[i]:self.offsets[i + 1]]
+        return sample
+
+    def records(self):
+        with open(os.path.join(self.root, "records.jsonl"), encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def _decode_depth(data: bytes, depth_format: str) -> np.ndarray:
+    if depth_format == "mm16":
+        mm = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_UNCHANGED)
+        depth = mm.astype(np.float32) / 1000.0
+        depth[mm == 0] = DEPTH_INF
+        return depth
+    if depth_format == "npy":
+        return np.load(io.BytesIO(data))
+    if depth_format == "npz":
+        return np.load(io.BytesIO(data))["depth"]
+    raise ValueError(f"depth exported as {depth_format!r} is not metric, re-export with mm16, npy or npz")
+
+def _read_modality(src_dir: str, entry: dict, modality: str) -> bytes:
+    if "members" in entry:  # shards
+        return read_member(src_dir, entry, modality)
+    with open(os.path.join(src_dir, entry["files"][modality]), "rb") as f:
+        return f.read()
+
+def _decode_sample(src_dir: str, entry: dict) -> dict:
+    def png(modality):
+        return cv2.imdecode(np.frombuffer(_read_modality(src_dir, entry, modality), np.uint8), cv2.IMREAD_UNCHANGED)
+
+    return {
+        "rgb": png("rgb"),
+        "depth": _decode_depth(_read_modality(src_dir, entry, "depth"), entry.get("depth_format", "vis")),
+        "semantic": png("semantic").astype(np.int32),
+        "instance": png("instance").astype(np.int32),
+        "points": ply_from_bytes(_read_modality(src_dir, entry, "pointcloud")),
+    }
+
+def convert_to_memmap(src_dir: str, dst_dir: str) -> MemmapDataset:
+    """ Convert a `files` or `shards` export into the memmap layout. """
+    if os.path.exists(os.path.join(src_dir, "index.jsonl")):
+        entries = list(iter_index(src_dir))
+    else:  # files export from before index.jsonl
+        with open(os.path.join(src_dir, "index.json"), encoding="utf-8") as f:
+            entries = json.load(f)
+
+    if not entries:
+        raise ValueError(f"no scenes in {src_dir}")
+    cam = entries[0]["camera"]
+    with MemmapWriter(dst_dir, len(entries), cam["height"], cam["width"]) as writer, AnnotationSummary(dst_dir) as summary:
+        for e in entries:
+            record = {k: v for k, v in e.items() if k not in ("files", "shard", "members", "depth_format", "params", "sha256")}
+            writer.add(record, _decode_sample(src_dir, e))
+            summary.add(record)
+        summary.save(dst_dir)
+    return MemmapDataset(dst_dir)
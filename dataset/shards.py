@@ -0,0 +1,87 @@
+""" Sharded dataset output.
+
+Six small files per scene plus a monolithic `index.json` does not scale to millions of scenes. Instead, scenes
+are appended to fixed-size tar shards (`shard_00000.tar`, ... with `shard_size` scenes each) and described by
+`index.jsonl`, one record per line, written and flushed as each scene completes. Nothing grows in memory.
+
+Each index record is the usual scene record plus:
+
+* `shard`   -- tar file holding the scene
+* `members` -- {modality: [offset, size]} byte range of every member inside the shard, so a reader can
+  `seek` straight to one modality (or memory-map it) without scanning the tar
+
+Tar members carry fixed metadata (mtime 0, mode 0644) so shards are reproducible byte for byte. """
+
+import io
+import json
+import os
+import tarfile
+
+def shard_name(k: int) -> str:
+    return f"shard_{k:05d}.tar"
+
+def add_member(tar: tarfile.TarFile, name: str, data: bytes) -> list:
+    """ Append one file to `tar` and return the [offset, size] of its data inside the archive. """
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = 0
+    info.mode = 0o644
+    header = info.tobuf(tar.format, tar.encoding, tar.errors)
+    offset = tar.offset + len(header)
+    tar.addfile(info, io.BytesIO(data))
+    return [offset, len(data)]
+
+class ShardWriter:
+    def __init__(self, out_dir: str, shard_size: int, index_name: str = "index.jsonl"):
+        self.out_dir = out_dir
+        self.shard_size = shard_size
+        self._scenes = 0  # scenes written so far, decides the shard of the next one
+        self._shard = None
+        self._tar = None
+        self._index = open(os.path.join(out_dir, index_name), "w", encoding="utf-8")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _shard_for_next_scene(self) -> str:
+        k = self._scenes // self.shard_size
+        if k != self._shard:
+            if self._tar is not None:
+                self._tar.close()
+            self._tar = tarfile.open(os.path.join(self.out_dir, shard_name(k)), "w", format=tarfile.PAX_FORMAT)
+            self._shard = k
+        return shard_name(k)
+
+    def add(self, record: dict, files: dict) -> dict:
+        shard = self._shard_for_next_scene()
+        by_name = {name: modality for modality, name in record["files"].items()}
+        members = {by_name[name]: add_member(self._tar, name, data) for name, data in files.items()}
+        members["record"] = add_member(self._tar, record["id"] + ".json", json.dumps(record).encode("utf-8"))
+        self._scenes += 1
+
+        entry = {**record, "shard": shard, "members": members}
+        self._index.write(json.dumps(entry) + "\n")
+        self._index.flush()
+        return entry
+
+    def close(self) -> None:
+        if self._tar is not None:
+            self._tar.close()
+            self._tar = None
+        self._index.close()
+
+def read_member(out_dir: str, entry: dict, modality: str) -> bytes:
+    """ Bytes of one modality of an index entry, read by offset without parsing the tar. """
+    offset, size = entry["members"][modality]
+    with open(os.path.join(out_dir, entry["shard"]), "rb") as f:
+        f.seek(offset)
+        return f.read(size)
+
+def iter_index(out_dir: str, index_name: str = "index.jsonl"):
+    with open(os.path.join(out_dir, index_name), encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,61 @@
+""" Point cloud decimation.
+
+A full back-projection keeps every object pixel (~300k points at 640x480), most of them redundant samples of
+flat billboards. Three optional reductions, applied in this order:
+
+* pixel stride -- keep every `stride`-th pixel in both directions, done by `depth_to_points` before back-projection
+* `voxel_downsample` -- keep one point per occupied voxel of edge `voxel_size`
+* `balanced_sample` -- fixed point budget that still keeps at least `min_per_instance` points of every instance
+
+All of them select existing points (never average), so colors and labels stay exact. """
+
+import numpy as np
+
+from telemetry.stages import stage
+
+def voxel_downsample(points: np.ndarray, voxel_size: float) -> np.ndarray:
+    if len(points) == 0:
+        return points
+    xyz = np.stack([points["x"], points["y"], points["z"]], axis=1)
+    cells = np.floor(xyz / voxel_size).astype(np.int64)
+    cells -= cells.min(axis=0)
+    dims = cells.max(axis=0) + 1
+    if np.prod(dims.astype(np.float64)) < 2 ** 62:
+        keys = np.ravel_multi_index(cells.T, dims)
+        _, first = np.unique(keys, return_index=True)
+    else:  # absurdly small voxels, linear keys would overflow
+        _, first = np.unique(cells, axis=0, return_index=True)
+    return points[np.sort(first)]  # first point of each voxel, original order
+
+def balanced_sample(points: np.ndarray, max_points: int, min_per_instance: int = 0, seed: int = 0) -> np.ndarray:
+    n = len(points)
+    if n <= max_points:
+        return points
+
+    rng = np.random.default_rng(seed)
+    perm = rng.permutation(n)
+    ids, inv, counts = np.unique(points["instance"][perm], return_inverse=True, return_counts=True)
+
+    # rank of every (shuffled) point inside its instance
+    by_instance = np.argsort(inv, kind="stable")
+    rank = np.empty(n, dtype=np.int64)
+    rank[by_instance] = np.arange(n) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    quota = np.minimum(counts, min_per_instance)
+    if quota.sum() > max_points:  # budget too small for the minimum, split it evenly instead
+        quota = np.minimum(counts, max_points // len(ids))
+    reserved = rank < quota[inv]
+
+    # whatever budget is left is filled uniformly from the remaining points
+    rest = np.flatnonzero(~reserved)[:max_points - int(reserved.sum())]
+    keep = perm[np.concatenate([np.flatnonzero(reserved), rest])]
+    return points[np.sort(keep)]
+
+@stage("decimate")
+def decimate(points: np.ndarray, voxel_size: float | None = None, max_points: int | None = None,
+             min_per_instance: int = 0, seed: int = 0) -> np.ndarray:
+    if voxel_size is not None:
+        points = voxel_downsample(points, voxel_size)
+    if max_points is not None:
+        points = balanced_sample(points, max_points, min_per_instance, seed)
+    return points
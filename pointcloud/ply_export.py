@@ -6,30 +6,87 @@ From the depth map, generate a labeled point cloud **in the camera frame**:
 * The resulting 3D coordinates are expressed in the camera's coordinate frame
 * Attach RGB color from the rendered color image
 * Attach semantic and instance labels from the segmentation masks
-* Export as `.ply` using Open3D
+* Export as `.ply` (written natively as binary little-endian PLY; Open3D is only needed for `to_open3d`)
 
 --- """
 
 import numpy as np
-import open3d as o3d
 
-def build_labeled_pointcloud(xyz: np.ndarray, rgb: np.ndarray, semantic: np.ndarray, instance: np.ndarray, valid: np.ndarray) -> o3d.geometry.PointCloud:
+from telemetry.stages import stage, POINTS_EXPORTED
 
-    pts = xyz[valid].reshape(-1, 3).astype(np.float32)
-    cols = (rgb[valid].reshape(-1, 3).astype(np.float32)) / 255.0
+# one PLY vertex per point, laid out exactly as it goes on disk (binary little endian)
+PLY_DTYPE = np.dtype([
+    ("x", "<f4"), ("y", "<f4"), ("z", "<f4"),
+    ("red", "u1"), ("green", "u1"), ("blue", "u1"),
+    ("semantic", "<i4"), ("instance", "<i4"),
+])
 
-    sem = semantic[valid].reshape(-1).astype(np.int32)
-    ins = instance[valid].reshape(-1).astype(np.int32)
+_PLY_TYPES = {"<f4": "float", "|u1": "uchar", "<i4": "int"}
 
-    pcd = o3d.geometry.PointCloud()
-    pcd.points = o3d.utility.Vector3dVector(pts)
-    pcd.colors = o3d.utility.Vector3dVector(cols)
+@stage("pointcloud_build")
+def build_labeled_pointcloud(xyz: np.ndarray, rgb: np.ndarray, semantic: np.ndarray, instance: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    """ `xyz`/`valid` are either the dense (H, W, 3) points with a boolean (H, W) mask from `depth_to_xyz`,
+    or the compact (N, 3) points with flat pixel indices from `depth_to_points`. """
+
+    if valid.dtype == bool:
+        flat = np.flatnonzero(valid)
+        xyz = xyz.reshape(-1, 3)[flat]
+    else:
+        flat = valid
+
+    pts = np.empty(len(flat), dtype=PLY_DTYPE)
+    rgb_v = rgb.reshape(-1, 3)[flat]
+    pts["x"], pts["y"], pts["z"] = xyz[:, 0], xyz[:, 1], xyz[:, 2]
+    pts["red"], pts["green"], pts["blue"] = rgb_v[:, 0], rgb_v[:, 1], rgb_v[:, 2]
 
     # attach labels hone
-    pcd.point["semantic"] = o3d.utility.IntVector(sem.tolist())
-    pcd.point["instance"] = o3d.utility.IntVector(ins.tolist())
+    pts["semantic"] = semantic.reshape(-1)[flat]
+    pts["instance"] = instance.reshape(-1)[flat]
 
-    return pcd
+    return pts
+
+def ply_header(num_points: int) -> bytes:
+    lines = ["ply", "format binary_little_endian 1.0", f"element vertex {num_points}"]
+    lines += [f"property {_PLY_TYPES[PLY_DTYPE[name].str]} {name}" for name in PLY_DTYPE.names]
+    lines.append("end_header")
+    return ("\n".join(lines) + "\n").encode("ascii")
+
+@stage("ply_write")
+def ply_bytes(points: np.ndarray) -> bytes:
+    # header + the structured array as one buffer, no per-point work
+    POINTS_EXPORTED.inc(len(points))
+    return ply_header(len(points)) + np.ascontiguousarray(points, dtype=PLY_DTYPE).tobytes()
 
-def save_ply(pcd: o3d.geometry.PointCloud, path: str) -> None:
-    o3d.io.write_point_cloud(path, pcd, write_ascii=False)
+def ply_from_bytes(data: bytes) -> np.ndarray:
+    """ Parse a PLY written by `ply_bytes` back into the structured array (zero-copy view of `data`). """
+    end = data.find(b"end_header\n")
+    if end < 0:
+        raise ValueError("not a PLY file")
+    end += len(b"end_header\n")
+    header = data[:end]
+    num_points = int(header.split(b"element vertex ")[1].split(b"\n")[0])
+    if header != ply_header(num_points):
+        raise ValueError("PLY layout differs from PLY_DTYPE")
+    return np.frombuffer(data, dtype=PLY_DTYPE, count=num_points, offset=end)
+
+@stage("ply_write")
+def write_ply(points: np.ndarray, f) -> None:
+    POINTS_EXPORTED.inc(len(points))
+    f.write(ply_header(len(points)))
+    f.write(memoryview(np.ascontiguousarray(points, dtype=PLY_DTYPE)).cast("B"))
+
+def save_ply(points: np.ndarray, path: str) -> None:
+    with open(path, "wb") as f:
+        write_ply(points, f)
+
+@stage("open3d")
+def to_open3d(points: np.ndarray):
+    """ Convert to an Open3D tensor point cloud (labels kept as per-point attributes), for visualization. """
+    import open3d as o3d
+
+    pcd = o3d.t.geometry.PointCloud()
+    pcd.point.positions = o3d.core.Tensor(np.stack([points["x"], points["y"], points["z"]], axis=1))
+    pcd.point.colors = o3d.core.Tensor(np.stack([points["red"], points["green"], points["blue"]], axis=1).astype(np.float32) / 255.0)
+    pcd.point.semantic = o3d.core.Tensor(points["semantic"][:, None])
+    pcd.point.instance = o3d.core.Tensor(points["instance"][:, None])
+    return pcd
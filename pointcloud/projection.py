@@ -1,19 +1,50 @@
 import numpy as np
 from config import DEPTH_INF
+from .ply_export import build_labeled_pointcloud
+from .decimate import decimate
+from telemetry.stages import stage
 
+@stage("backproject")
 def depth_to_xyz(depth: np.ndarray, camera) -> np.ndarray:
     
     H, W = depth.shape
-    u = np.arange(W, dtype=np.float32) #hole el pixels hk - w hk |
-    v = np.arange(H, dtype=np.float32)
-    uu, vv = np.meshgrid(u, v)  #shapes (H,W)
+    ray_x, ray_y = camera.rays()  # cached (u-cx)/fx and (v-cy)/fy
     z = depth.astype(np.float32)
     valid = z < (DEPTH_INF * 0.5) #bs threshold hay true iza belongs la object
     # reverse el projection yali 3mlneha
-    x = (uu - camera.cx) * (z / camera.fx)
-    y = (vv - camera.cy) * (z / camera.fy)
-
-    xyz = np.stack([x, y, z], axis=-1)  # (H,W,3)
+    xyz = np.empty((H, W, 3), dtype=np.float32)
+    np.multiply(ray_x[None, :], z, out=xyz[..., 0])
+    np.multiply(ray_y[:, None], z, out=xyz[..., 1])
+    xyz[..., 2] = z
     xyz[~valid] = np.nan #mn2im el fake
 
     return xyz, valid
+
+@stage("backproject")
+def depth_to_points(depth: np.ndarray, camera, stride: int = 1) -> tuple[np.ndarray, np.ndarray]:
+    """ Sparse back-projection: only pixels that hit an object are touched.
+    Returns compact (N, 3) float32 points and their flat pixel indices into the (H, W) image.
+    `stride` > 1 only considers every stride-th row and column. """
+    H, W = depth.shape
+    sub = depth[::stride, ::stride] if stride > 1 else depth
+    hits = np.flatnonzero(sub < (DEPTH_INF * 0.5))
+    rows, cols = np.divmod(hits, sub.shape[1])
+    rows *= stride
+    cols *= stride
+    flat = rows * W + cols
+
+    ray_x, ray_y = camera.rays()
+    z = depth.reshape(-1)[flat].astype(np.float32)
+    xyz = np.empty((len(flat), 3), dtype=np.float32)
+    np.multiply(ray_x[cols], z, out=xyz[:, 0])
+    np.multiply(ray_y[rows], z, out=xyz[:, 1])
+    xyz[:, 2] = z
+    return xyz, flat
+
+def labeled_points(out: dict, camera, stride: int = 1, voxel_size: float | None = None, max_points: int | None = None,
+                   min_points_per_instance: int = 0) -> np.ndarray:
+    """ Labeled `PLY_DTYPE` point cloud of a `render_scene` output, optionally decimated (see `decimate.py`).
+    Points are in the camera frame, `camera.camera_to_world` takes them to world coordinates. """
+    xyz, flat = depth_to_points(out["depth"], camera, stride=stride)
+    points = build_labeled_pointcloud(xyz, out["rgb"], out["semantic"], out["instance"], flat)
+    return decimate(points, voxel_size, max_points, min_points_per_instance)
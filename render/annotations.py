@@ -0,0 +1,126 @@
+""" Per-instance annotations of a render, so dataset consumers do not have to decode masks to get them.
+
+For every object of the scene, in scene order:
+
+* `area`       -- visible pixels in the instance mask
+* `bbox`       -- (x0, y0, x1, y1) inclusive pixel box of the visible pixels, -1 when nothing is visible
+* `footprint`  -- pixels the object would cover if nothing occluded it (inside the image)
+* `visibility` -- area / footprint: 1 unoccluded, 0 fully hidden (or off screen)
+
+plus `class_pixels`, the semantic histogram (index = class id, 0 = background).
+
+All of it comes from one pass over the instance buffer: every row is split into runs of equal ids, and only
+the runs are grouped per id (sort + `reduceat`), which is a few thousand entries instead of every pixel. The
+semantic histogram follows from the areas, since both masks are written together. Footprints reuse the
+renderer's projection and its cached shape stamps, only objects cut by the image border are clipped one by one. """
+
+from functools import lru_cache
+
+import numpy as np
+
+from scene.scene import SHAPES
+from scene.scene_object import Shape
+from .raster import shape_stamp, _stamp_window
+from .renderer import project_objects, _STAMP_KIND
+from telemetry.stages import stage
+
+@lru_cache(maxsize=4096)
+def _stamp_area(kind: str, rx: int, ry: int) -> int:
+    return int(np.count_nonzero(shape_stamp(kind, rx, ry)))
+
+def _runs(instance: np.ndarray):
+    """ (id, first flat index, last flat index) of every run of equal non-zero ids along the rows. """
+    H, W = instance.shape
+    edge = np.empty((H, W), dtype=bool)
+    edge[:, 0] = True
+    np.not_equal(instance[:, 1:], instance[:, :-1], out=edge[:, 1:])
+    starts = np.flatnonzero(edge)
+    ends = np.r_[starts[1:], H * W] - 1
+    ids = instance.reshape(-1)[starts]
+    keep = ids > 0
+    return ids[keep], starts[keep], ends[keep]
+
+def _footprints(scene, projection, W: int, H: int) -> np.ndarray:
+    visible, u, v, _, base = projection
+    shape = scene.shape_code
+    rx = base
+    ry = np.where(shape == SHAPES.index(Shape.cylinder), np.maximum(1, base // 2), base)
+
+    # unclipped areas only depend on (shape, rx, ry), which repeat a lot
+    keys, inverse = np.unique(np.stack([shape, rx, ry], axis=1), axis=0, return_inverse=True)
+    areas = np.array([_stamp_area(_STAMP_KIND[s], int(a), int(b)) for s, a, b in keys], dtype=np.int64)
+    footprint = areas[inverse.reshape(-1)] if len(keys) else np.zeros(0, dtype=np.int64)
+
+    cut = visible & ((u - rx < 0) | (u + rx >= W) | (v - ry < 0) | (v + ry >= H))
+    for k in np.flatnonzero(cut):
+        mask = _stamp_window(_STAMP_KIND[shape[k]], int(u[k]), int(v[k]), int(rx[k]), int(ry[k]), W, H)[2]
+        footprint[k] = np.count_nonzero(mask)
+    footprint[~visible] = 0  # the renderer skips objects whose centre is off screen
+    return footprint
+
+@stage("annotate")
+def instance_annotations(out: dict, scene, camera, projection=None) -> dict:
+    """ Annotation columns of a `render_scene(scene, camera)` output, see the module docstring.
+    `projection` is this camera's `project_objects(scene, camera)` when the caller already has it. """
+    instance = out["instance"]
+    H, W = instance.shape
+    n = len(scene)
+    instance_ids = scene.instance_id
+    class_ids = scene.class_id
+
+    ids, starts, ends = _runs(instance)
+    order = np.argsort(ids, kind="stable")  # stable: runs of an id stay in raster order
+    ids, starts, ends = ids[order], starts[order], ends[order]
+    first = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]]) if len(ids) else np.zeros(0, dtype=np.int64)
+    last = np.r_[first[1:], len(ids)] - 1
+    rows = starts // W
+
+    size = int(max(instance_ids.max(initial=0), ids.max(initial=0))) + 1
+    area_by_id = np.zeros(size, dtype=np.int64)
+    bbox_by_id = np.full((size, 4), -1, dtype=np.int64)
+    present = ids[first]
+    if len(present):
+        area_by_id[present] = np.add.reduceat(ends - starts + 1, first)
+        bbox_by_id[present, 0] = np.minimum.reduceat(starts - rows * W, first)
+        bbox_by_id[present, 1] = rows[first]
+        bbox_by_id[present, 2] = np.maximum.reduceat(ends - rows * W, first)
+        bbox_by_id[present, 3] = rows[last]
+
+    area = area_by_id[instance_ids]
+    if projection is None:
+        projection = project_objects(scene, camera)
+    footprint = _footprints(scene, projection, W, H)
+    visibility = np.divide(area, footprint, out=np.zeros(n), where=footprint > 0)
+
+    class_pixels = np.bincount(class_ids, weights=area, minlength=1).astype(np.int64) if n else np.zeros(1, dtype=np.int64)
+    class_pixels[0] = H * W - area.sum()
+    return {
+        "instance_id": instance_ids.astype(np.int32),
+        "class_id": class_ids.astype(np.int32),
+        "area": area,
+        "bbox": bbox_by_id[instance_ids],
+        "footprint": footprint,
+        "visibility": visibility,
+        "class_pixels": class_pixels,
+    }
+
+def annotations_json(ann: dict) -> dict:
+    """ The annotation columns as the JSON block stored in dataset records. """
+    instances = [
+        {
+            "instance_id": int(iid),
+            "class_id": int(cid),
+            "bbox": [int(c) for c in box] if area else None,
+            "area": int(area),
+            "footprint": int(fp),
+            "visibility": round(float(vis), 4),
+        }
+        for iid, cid, box, area, fp, vis in zip(ann["instance_id"], ann["class_id"], ann["bbox"], ann["area"],
+                                                ann["footprint"], ann["visibility"])
+    ]
+    visible_classes = ann["class_id"][ann["area"] > 0]
+    return {
+        "instances": instances,
+        "class_pixels": {str(c): int(p) for c, p in enumerate(ann["class_pixels"]) if p},
+        "class_instances": {str(c): int(k) for c, k in zip(*np.unique(visible_classes, return_counts=True))},
+    }
@@ -0,0 +1,185 @@
+""" Render cache shared by the API endpoints.
+
+Every `/render/*` and `/pointcloud` request used to call `render_scene` from scratch. The cache memoizes
+the `render_scene` output dict plus the encoded bytes of each modality, keyed on (scene version, camera
+intrinsics and pose), so fetching all modalities of one scene costs a single rasterization.
+Memory is bounded both by entry count and by total bytes, oldest entries are evicted first (LRU).
+`renderer` replaces `render_scene` on a miss, e.g. to fetch renders from the store shared by API workers.
+Concurrent misses on the same key share one render (`SingleFlight`). Encodings computed elsewhere (render
+worker processes) are added with `store` and found with `lookup`, without the arrays behind them.
+
+`hits` / `misses` count requests, once each: `render` counts itself (a hit only when the arrays are cached) unless
+its caller counts, like the encoded requests, which are counted by whoever answers them (`RenderOffload`) through
+`count`. """
+
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from .renderer import render_scene
+
+def _nbytes(value) -> int:
+    if isinstance(value, dict):
+        return sum(_nbytes(v) for v in value.values())
+    return getattr(value, "nbytes", None) or len(value)
+
+class RenderQueueFull(Exception):
+    pass
+
+class SingleFlight:
+    """ Calls with the same key while one is running share its result instead of computing it again.
+    With `max_pending`, starting yet another distinct computation raises `RenderQueueFull`. """
+
+    def __init__(self, max_pending: int | None = None):
+        self.max_pending = max_pending
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                if self.max_pending is not None and len(self._calls) >= self.max_pending:
+                    raise RenderQueueFull(f"{len(self._calls)} renders in flight, try again shortly")
+                call = self._calls[key] = Future()
+        if not leader:
+            return call.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+class RenderCache:
+    def __init__(self, max_entries: int = 8, max_bytes: int = 256 * 1024 * 1024, renderer=render_scene):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._renderer = renderer
+        self._rendering = SingleFlight()
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(scene, camera) -> tuple:
+        return (scene.version, camera.intrinsics(), camera.pose())
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _add_bytes(self, key, n: int) -> None:
+        # caller holds the lock
+        self._entries[key]["nbytes"] += n
+        self._nbytes += n
+        self._evict()
+
+    def _evict(self) -> None:
+        while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self._nbytes > self.max_bytes):
+            _, old = self._entries.popitem(last=False)
+            self._nbytes -= old["nbytes"]
+
+    def render(self, scene, camera, count: bool = True) -> dict:
+        entry, hit = self._entry(scene, camera)
+        if count:
+            self.count(hit)
+        return entry["out"]
+
+    def arrays(self, scene, camera) -> dict | None:
+        """ Cached `render_scene` output of this scene/camera, None without rendering anything when missing. """
+        entry = self._get(self.key(scene, camera))
+        return None if entry is None else entry["out"]
+
+    def _entry(self, scene, camera) -> tuple[dict, bool]:
+        """ The cache entry with its arrays, rendering them if needed, and whether they were cached. """
+        key = self.key(scene, camera)
+        entry = self._get(key)
+        if entry is not None and entry["out"] is not None:
+            return entry, True
+        return self._rendering.do(key, lambda: self._render(key, scene, camera)), False
+
+    def _render(self, key, scene, camera) -> dict:
+        out = self._renderer(scene, camera)
+        for arr in out.values():
+            arr.flags.writeable = False  # shared between requests
+
+        with self._lock:
+            entry = self._slot(key)
+            if entry["out"] is None:  # may have been rendered while this render was running
+                entry["out"] = out
+                self._add_bytes(key, _nbytes(out))
+        return entry
+
+    def _slot(self, key) -> dict:
+        # caller holds the lock
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = {"out": None, "encoded": {}, "nbytes": 0}
+            self._entries[key] = entry
+        return entry
+
+    def lookup(self, scene, camera, name) -> bytes | None:
+        """ Cached encoding `name` of this scene/camera, None without rendering anything when missing. """
+        with self._lock:
+            entry = self._entries.get(self.key(scene, camera))
+            data = None if entry is None else entry["encoded"].get(name)
+            if data is not None:
+                self._entries.move_to_end(self.key(scene, camera))
+            return data
+
+    def store(self, scene, camera, name, data: bytes) -> None:
+        key = self.key(scene, camera)
+        with self._lock:
+            entry = self._slot(key)
+            if name not in entry["encoded"]:
+                entry["encoded"][name] = data
+                self._add_bytes(key, _nbytes(data))
+
+    def encoded(self, scene, camera, name, encode) -> bytes:
+        """ Return `encode(out)` for this scene/camera, computing it at most once per cache entry.
+        `name` identifies the encoding (e.g. an `EncodeSpec`). """
+        data = self.lookup(scene, camera, name)
+        if data is not None:
+            return data
+
+        data = encode(self._entry(scene, camera)[0]["out"])
+        self.store(scene, camera, name, data)
+        return data
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._nbytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
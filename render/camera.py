@@ -1,4 +1,45 @@
-from dataclasses import dataclass
+""" Pinhole camera with an optional pose.
+
+Camera frame: x right, y down, z along the optical axis. `position` is the camera centre in world coordinates
+and `rotation_rpy` its orientation as (roll, pitch, yaw) in radians, the same convention as the scene objects:
+the camera-to-world rotation is Rz(yaw) @ Ry(pitch) @ Rx(roll). The default pose puts the camera at the world
+origin looking down +z, so world and camera coordinates coincide. """
+
+from dataclasses import dataclass, field, replace
+
+import numpy as np
+
+def rotation_matrix(rpy) -> np.ndarray:
+    """ Rz(yaw) @ Ry(pitch) @ Rx(roll) for (roll, pitch, yaw) in radians. """
+    r, p, y = rpy
+    cr, sr = np.cos(r), np.sin(r)
+    cp, sp = np.cos(p), np.sin(p)
+    cy, sy = np.cos(y), np.sin(y)
+    return np.array([
+        [cy * cp, cy * sp * sr - sy * cr, cy * sp * cr + sy * sr],
+        [sy * cp, sy * sp * sr + cy * cr, sy * sp * cr - cy * sr],
+        [-sp, cp * sr, cp * cr],
+    ])
+
+def _look_at_rpy(position, target) -> tuple[float, float, float]:
+    forward = np.subtract(target, position, dtype=np.float64)
+    norm = np.linalg.norm(forward)
+    if norm == 0:
+        raise ValueError("look_at target coincides with the camera position")
+    forward /= norm
+    right = np.cross((0.0, 1.0, 0.0), forward)  # keep the image's "down" along world +y
+    if np.linalg.norm(right) < 1e-9:  # looking straight along y, any roll will do
+        right = np.array([1.0, 0.0, 0.0])
+    right /= np.linalg.norm(right)
+    down = np.cross(forward, right)
+    R = np.column_stack([right, down, forward])
+    cos_pitch = np.hypot(R[0, 0], R[1, 0])
+    pitch = np.arctan2(-R[2, 0], cos_pitch)
+    if cos_pitch < 1e-9:  # gimbal lock (camera x axis along world z, e.g. looking along x): roll absorbs yaw
+        roll, yaw = np.arctan2(-R[1, 2], R[1, 1]), 0.0
+    else:
+        roll, yaw = np.arctan2(R[2, 1], R[2, 2]), np.arctan2(R[1, 0], R[0, 0])
+    return tuple(float(a) + 0.0 for a in (roll, pitch, yaw))  # + 0.0 turns -0.0 into 0.0
 
 @dataclass
 class PinholeCamera:
@@ -8,15 +49,73 @@ class PinholeCamera:
     fy: float #focal lengths
     cx: float
     cy: float #principal point
+    position: tuple[float, float, float] = (0.0, 0.0, 0.0) #camera centre in world coordinates
+    rotation_rpy: tuple[float, float, float] = (0.0, 0.0, 0.0) #camera-to-world rotation, see above
+
+    _rays: tuple | None = field(default=None, init=False, repr=False, compare=False)
+
+    def intrinsics(self) -> tuple[int, int, float, float, float, float]:
+        return (self.width, self.height, self.fx, self.fy, self.cx, self.cy)
+
+    def pose(self) -> tuple[float, float, float, float, float, float]:
+        return (*self.position, *self.rotation_rpy)
+
+    def with_pose(self, position=(0.0, 0.0, 0.0), rotation_rpy=(0.0, 0.0, 0.0), look_at=None) -> "PinholeCamera":
+        """ Same intrinsics at another pose. With `look_at` (a world point) the camera is turned towards it
+        and `rotation_rpy` is ignored. """
+        if look_at is not None:
+            rotation_rpy = _look_at_rpy(position, look_at)
+        return replace(self, position=tuple(float(c) for c in position),
+                       rotation_rpy=tuple(float(a) for a in rotation_rpy))
+
+    def rotation(self) -> np.ndarray:
+        return rotation_matrix(self.rotation_rpy)
+
+    def world_to_camera(self, points) -> np.ndarray:
+        """ (N, 3) world points in camera coordinates. """
+        points = np.asarray(points, dtype=np.float64)
+        if not any(self.pose()):
+            return points
+        return (points - self.position) @ self.rotation()
+
+    def camera_to_world(self, points) -> np.ndarray:
+        """ (N, 3) camera-frame points (e.g. a point cloud from `depth_to_points`) in world coordinates. """
+        points = np.asarray(points, dtype=np.float64)
+        if not any(self.pose()):
+            return points
+        return points @ self.rotation().T + self.position
+
+    def rays(self) -> tuple[np.ndarray, np.ndarray]:
+        """ Ray table for back-projection: ((u - cx) / fx per column, (v - cy) / fy per row), float32.
+        A pixel (u, v) at depth z is at (ray_x[u] * z, ray_y[v] * z, z). Cached until the intrinsics change. """
+        key = self.intrinsics()
+        if self._rays is None or self._rays[0] != key:
+            ray_x = ((np.arange(self.width, dtype=np.float64) - self.cx) / self.fx).astype(np.float32)
+            ray_y = ((np.arange(self.height, dtype=np.float64) - self.cy) / self.fy).astype(np.float32)
+            ray_x.flags.writeable = False
+            ray_y.flags.writeable = False
+            self._rays = (key, ray_x, ray_y)
+        return self._rays[1], self._rays[2]
 
     #el input 3d point 
     #pixel coordinates w depth => output
     def project(self, xyz: tuple[float, float, float]) -> tuple[int, int, float] | None:
-        x, y, z = xyz
-        if z <= 0: #hay y3ne wara el camera
+        u, v, z = project_many([self], [xyz])
+        if z[0, 0] <= 0: #hay y3ne wara el camera
             return None
 
-        u = self.fx * (x / z) + self.cx
-        v = self.fy * (y / z) + self.cy
+        return int(round(u[0, 0])), int(round(v[0, 0])), float(z[0, 0]) #round la2an el pixels discrete values
+
+def project_many(cameras, points) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """ Project (N, 3) world points into K cameras in one go. Returns (u, v, z), each (K, N) float64: unrounded
+    pixel coordinates and the depth along each camera's optical axis. u and v are meaningless where z <= 0
+    (behind the camera). """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    t = np.array([c.position for c in cameras], dtype=np.float64)
+    R = np.stack([c.rotation() for c in cameras])
+    xyz = np.einsum("knj,kji->kni", points[None] - t[:, None], R)  # (p - t) @ R for every camera
 
-        return int(round(u)), int(round(v)), float(z) #round la2an el pixels discrete values
+    fx, fy, cx, cy = (np.array([getattr(c, a) for c in cameras], dtype=np.float64)[:, None] for a in ("fx", "fy", "cx", "cy"))
+    x, y, z = xyz[..., 0], xyz[..., 1], xyz[..., 2]
+    zs = np.where(z > 0, z, 1.0)  # keep the division quiet for points behind the camera
+    return fx * (x / zs) + cx, fy * (y / zs) + cy, z
@@ -0,0 +1,102 @@
+""" Encoders for the render outputs, shared by the API endpoints and the dataset export.
+
+Depth can be written as:
+
+* `vis`  -- 8-bit PNG, min/max normalized per image, for looking at (background white)
+* `mm16` -- 16-bit PNG of metric depth in millimetres, background 0, comparable across scenes
+* `npy`  -- raw float32 depth as `.npy`, background keeps `DEPTH_INF`
+* `npz`  -- same array in a compressed `.npz` (key `depth`)
+
+`png_compression` is OpenCV's `IMWRITE_PNG_COMPRESSION` (0-9); None keeps the OpenCV default.
+
+`EncodeSpec` names one encoded modality completely. It is hashable and picklable, so it serves both as cache key
+and as the job description sent to render worker processes (`encode_output`). """
+
+import io
+from typing import NamedTuple
+
+import cv2
+import numpy as np
+
+from config import DEPTH_INF
+from pointcloud.projection import labeled_points
+from pointcloud.ply_export import ply_bytes
+from telemetry.stages import stage
+
+# format -> (file extension, media type)
+DEPTH_FORMATS = {
+    "vis": (".png", "image/png"),
+    "mm16": (".png", "image/png"),
+    "npy": (".npy", "application/octet-stream"),
+    "npz": (".npz", "application/octet-stream"),
+}
+
+@stage("png_encode")
+def _png(img: np.ndarray, png_compression: int | None) -> bytes:
+    params = [] if png_compression is None else [cv2.IMWRITE_PNG_COMPRESSION, int(png_compression)]
+    ok, buf = cv2.imencode(".png", img, params)
+    if not ok:
+        raise RuntimeError("PNG encoding failed")
+    return buf.tobytes()
+
+def png_bytes_uint8(img: np.ndarray, png_compression: int | None = None) -> bytes:
+    return _png(img, png_compression)
+
+def png_bytes_mask16(mask: np.ndarray, png_compression: int | None = None) -> bytes:
+    mask16 = mask.astype(np.uint16)
+    return _png(mask16, png_compression)
+
+def png_bytes_depth_vis(depth: np.ndarray, png_compression: int | None = None) -> bytes:
+    d = depth.copy()
+    d[d >= DEPTH_INF * 0.5] = np.nan  # background
+    mn = np.nanmin(d)
+    mx = np.nanmax(d)
+    vis = 255 * (d - mn) / (mx - mn + 1e-6)
+    vis = np.nan_to_num(vis, nan=255).astype(np.uint8)
+    return _png(vis, png_compression)
+
+def png_bytes_depth_mm16(depth: np.ndarray, png_compression: int | None = None) -> bytes:
+    mm = np.rint(depth * 1000.0)
+    mm[depth >= DEPTH_INF * 0.5] = 0  # background
+    return _png(np.clip(mm, 0, 65535).astype(np.uint16), png_compression)
+
+@stage("array_encode")
+def npy_bytes(arr: np.ndarray) -> bytes:
+    buf = io.BytesIO()
+    np.save(buf, arr)
+    return buf.getvalue()
+
+@stage("array_encode")
+def npz_bytes(**arrays) -> bytes:
+    buf = io.BytesIO()
+    np.savez_compressed(buf, **arrays)
+    return buf.getvalue()
+
+def encode_depth(depth: np.ndarray, depth_format: str = "vis", png_compression: int | None = None) -> bytes:
+    if depth_format == "vis":
+        return png_bytes_depth_vis(depth, png_compression)
+    if depth_format == "mm16":
+        return png_bytes_depth_mm16(depth, png_compression)
+    if depth_format == "npy":
+        return npy_bytes(depth.astype(np.float32, copy=False))
+    if depth_format == "npz":
+        return npz_bytes(depth=depth.astype(np.float32, copy=False))
+    raise ValueError(f"unknown depth format {depth_format!r}, expected one of {list(DEPTH_FORMATS)}")
+
+class EncodeSpec(NamedTuple):
+    modality: str  # rgb, depth, semantic, instance or pointcloud
+    png_compression: int | None = None
+    depth_format: str = "vis"
+    pointcloud: tuple = ()  # (option, value) pairs for `labeled_points`, e.g. (("stride", 2),)
+
+def encode_output(out: dict, camera, spec: EncodeSpec) -> bytes:
+    """ Encoded bytes of one modality of a `render_scene` output. """
+    if spec.modality == "rgb":
+        return png_bytes_uint8(out["rgb"], spec.png_compression)
+    if spec.modality == "depth":
+        return encode_depth(out["depth"], spec.depth_format, spec.png_compression)
+    if spec.modality in ("semantic", "instance"):
+        return png_bytes_mask16(out[spec.modality], spec.png_compression)
+    if spec.modality == "pointcloud":
+        return ply_bytes(labeled_points(out, camera, **dict(spec.pointcloud)))
+    raise ValueError(f"unknown modality {spec.modality!r}")
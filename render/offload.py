@@ -0,0 +1,75 @@
+""" Render/encode offload for the API.
+
+The render endpoints are plain `def` handlers on FastAPI's threadpool. Rasterizing, PNG encoding and building
+point clouds there makes a burst of requests fight over the GIL, and identical concurrent requests each did the
+full work. `RenderOffload` sits between the endpoints and the `RenderCache`:
+
+* concurrent requests for the same (scene version, camera, `EncodeSpec`) share one computation
+* at most `max_pending` distinct computations are in flight, the next one raises `RenderQueueFull` (HTTP 503)
+* with `workers` > 0 the computation runs in a process pool. The scene and camera are pickled to a worker, which
+  renders (keeping a small cache of its own, so further modalities of the same scene skip the render) and sends
+  back only the encoded bytes. With 0 it runs in the request thread.
+
+Raw arrays (`render`) share computations and count against `max_pending` the same way, but are always rendered
+in this process, through the cache: shipping full-size buffers back from a worker would cost about as much as
+rendering them. """
+
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from .cache import RenderCache, SingleFlight
+from .encoding import encode_output
+from telemetry.stages import stage
+
+_WORKER_CACHE = None  # per worker process
+
+def process_pool(workers: int) -> ProcessPoolExecutor:
+    """ Process pool that is safe to start from server threads: spawn, since forking a threaded process is not. """
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+def _render_encode(scene, camera, spec) -> bytes:
+    global _WORKER_CACHE
+    if _WORKER_CACHE is None:
+        _WORKER_CACHE = RenderCache(max_entries=2)
+    return _WORKER_CACHE.encoded(scene, camera, spec, lambda out: encode_output(out, camera, spec))
+
+class RenderOffload:
+    def __init__(self, cache: RenderCache, workers: int = 0, max_pending: int = 32):
+        self.cache = cache
+        self.workers = workers
+        self._flights = SingleFlight(max_pending)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:  # started on first use, not when the module is imported
+                self._pool = process_pool(self.workers)
+            return self._pool
+
+    def encoded(self, scene, camera, spec) -> bytes:
+        data = self.cache.lookup(scene, camera, spec)
+        self.cache.count(hit=data is not None)  # a miss even when it joins a computation already running
+        if data is not None:
+            return data
+        return self._flights.do((self.cache.key(scene, camera), spec), lambda: self._compute(scene, camera, spec))
+
+    def _compute(self, scene, camera, spec) -> bytes:
+        if self.workers == 0:
+            return self.cache.encoded(scene, camera, spec, lambda out: encode_output(out, camera, spec))
+        with stage("render_worker"):
+            data = self._executor().submit(_render_encode, scene, camera, spec).result()
+        self.cache.store(scene, camera, spec, data)
+        return data
+
+    def render(self, scene, camera) -> dict:
+        out = self.cache.arrays(scene, camera)
+        self.cache.count(hit=out is not None)
+        if out is not None:
+            return out
+        return self._flights.do((self.cache.key(scene, camera), "arrays"),
+                                lambda: self.cache.render(scene, camera, count=False))
+
+    def pending(self) -> int:
+        return self._flights.pending()
@@ -1,4 +1,7 @@
+from functools import lru_cache
+
 import numpy as np
+from config import STAMP_CACHE_SIZE
 
 def clip_box(x0, y0, x1, y1, w, h):
     x0 = max(0, x0)
@@ -7,25 +10,39 @@ def clip_box(x0, y0, x1, y1, w, h):
     y1 = min(h - 1, y1)
     return x0, y0, x1, y1
 
+@lru_cache(maxsize=STAMP_CACHE_SIZE)
+def shape_stamp(kind: str, rx: int, ry: int) -> np.ndarray:
+    """ Full (2*ry+1, 2*rx+1) boolean mask of a shape centred in its box. Radii are small integers that
+    repeat all the time, so stamps are built once and reused (LRU bounded); callers must not write to them. """
+    yy, xx = np.ogrid[-ry:ry+1, -rx:rx+1]
+    if kind == "circle":
+        mask = xx ** 2 + yy ** 2 <= rx ** 2 #equation of circle
+    elif kind == "rect":
+        mask = np.ones((2 * ry + 1, 2 * rx + 1), dtype=bool)
+    elif kind == "ellipse":
+        mask = (xx / rx) ** 2 + (yy / ry) ** 2 <= 1.0
+    else:
+        raise ValueError(f"unknown stamp kind {kind!r}")
+    mask.flags.writeable = False
+    return mask
+
+def _stamp_window(kind, u, v, rx, ry, w, h):
+    x0, y0, x1, y1 = clip_box(u - rx, v - ry, u + rx, v + ry, w, h)
+    # clipping at the image border is just a slice of the cached stamp
+    mask = shape_stamp(kind, rx, ry)[y0-(v-ry):y1-(v-ry)+1, x0-(u-rx):x1-(u-rx)+1]
+    return (slice(y0, y1+1), slice(x0, x1+1), mask)
+
 def raster_circle(u: int, v: int, r: int, w: int, h: int): #center (u,v) radius r
     if r <= 0:
         return None
-    x0, y0, x1, y1 = clip_box(u - r, v - r, u + r, v + r, w, h)
-    yy, xx = np.ogrid[y0:y1+1, x0:x1+1] #kl el pixels bl bounding boxe
-    mask = (xx - u) ** 2 + (yy - v) ** 2 <= r ** 2 #equation of circle
-    return (slice(y0, y1+1), slice(x0, x1+1), mask) #bs mne5od el sha2fe yali fiha
+    return _stamp_window("circle", u, v, r, r, w, h)
 
 def raster_rect(u: int, v: int, half: int, w: int, h: int):
     if half <= 0:
         return None
-    x0, y0, x1, y1 = clip_box(u - half, v - half, u + half, v + half, w, h)
-    mask = np.ones((y1 - y0 + 1, x1 - x0 + 1), dtype=bool)
-    return (slice(y0, y1+1), slice(x0, x1+1), mask)
+    return _stamp_window("rect", u, v, half, half, w, h)
 
 def raster_ellipse(u: int, v: int, rx: int, ry: int, w: int, h: int):
     if rx <= 0 or ry <= 0:
         return None
-    x0, y0, x1, y1 = clip_box(u - rx, v - ry, u + rx, v + ry, w, h)
-    yy, xx = np.ogrid[y0:y1+1, x0:x1+1]
-    mask = ((xx - u) / rx) ** 2 + ((yy - v) / ry) ** 2 <= 1.0
-    return (slice(y0, y1+1), slice(x0, x1+1), mask)
+    return _stamp_window("ellipse", u, v, rx, ry, w, h)
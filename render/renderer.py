@@ -29,37 +29,98 @@ Implement a simple **pinhole camera model** and generate all output modalities.
 """
 
 import numpy as np
-from .raster import raster_circle, raster_rect, raster_ellipse
-from config import DEPTH_INF, SIZE_K
+from .camera import project_many
+from .raster import raster_circle, raster_rect, raster_ellipse, shape_stamp
+from scene.scene import SHAPES
+from scene.scene_object import Shape
+from config import DEPTH_INF, SIZE_K, RENDER_ENGINE
+from telemetry.stages import stage, SCENES_RENDERED, OBJECTS_RASTERIZED
+
+# stamp kinds of raster.py per shape code: spheres are circles, cubes squares, cylinders flat ellipses
+_STAMP_KIND = ["circle" if s is Shape.sphere else "rect" if s is Shape.cube else "ellipse" for s in SHAPES]
 
 def to_u8(rgb01):
     return np.clip(np.array(rgb01) * 255.0, 0, 255).astype(np.uint8)
 
-def render_scene(scene, camera):
-
-    H, W = camera.height, camera.width
+def project_views(scene, cameras):
+    """ Project every object centre into every camera at once and size its billboard.
+    Returns (visible, u, v, z, base), each (K, N) for K cameras: objects in front of the camera whose centre
+    lands inside the image, their pixel, depth along the camera axis and billboard size. """
+    u, v, z = project_many(cameras, scene.position)
+    in_front = z > 0
+    zs = np.where(in_front, z, 1.0)
+    u = np.rint(u)  # rint rounds half to even, same as round()
+    v = np.rint(v)
+    width = np.array([c.width for c in cameras])[:, None]
+    height = np.array([c.height for c in cameras])[:, None]
+    visible = in_front & (u >= 0) & (u < width) & (v >= 0) & (v < height)
+    u = np.where(visible, u, 0).astype(np.int64)
+    v = np.where(visible, v, 0).astype(np.int64)
+
+    #pixel size conversion
+    scale = scene.scale
+    s_avg = (scale[:, 0] + scale[:, 1] + scale[:, 2]) / 3.0
+    base = np.maximum(1, np.rint(SIZE_K * (s_avg / zs)).astype(np.int64))
+    return visible, u, v, z, base
+
+def project_objects(scene, camera):
+    """ `project_views` for a single camera, every array (N,). """
+    return tuple(a[0] for a in project_views(scene, [camera]))
+
+def _empty_buffers(H, W):
     rgb = np.zeros((H, W, 3), dtype=np.uint8)
     depth = np.full((H, W), DEPTH_INF, dtype=np.float32)
     semantic = np.zeros((H, W), dtype=np.int32)
     instance = np.zeros((H, W), dtype=np.int32)
+    return rgb, depth, semantic, instance
+
+def render_scene(scene, camera, engine: str = RENDER_ENGINE, tile_size: int = 64, projection=None):
+    """ Render RGB, depth, semantic and instance buffers.
+    `engine="zbuffer"` rasterizes object by object into a Z-buffer; `engine="tiled"` paints objects front to
+    back so every pixel is written once, and keeps the free pixels per `tile_size` tile to skip hidden objects
+    without touching their pixels. Both give identical images. The tiled engine is faster once thousands of
+    objects overlap; with up to a few hundred objects at 1080p and above its full-image passes cost more than
+    the Z-buffer's per-object writes, so the Z-buffer stays the default.
+    `projection` is this camera's `project_objects(scene, camera)` when the caller already has it. """
+    if engine not in ("zbuffer", "tiled"):
+        raise ValueError(f"unknown render engine {engine!r}, expected 'zbuffer' or 'tiled'")
+    with stage("render"):
+        if projection is None:
+            projection = project_objects(scene, camera)
+        if engine == "zbuffer":
+            out = _render_zbuffer(scene, camera, projection)
+        else:
+            out = _render_tiled(scene, camera, tile_size, projection)
+    SCENES_RENDERED.inc()
+    OBJECTS_RASTERIZED.inc(int(np.count_nonzero(projection[0])))
+    return out
 
-    for obj in scene.objects:
+def render_views(scene, cameras, engine: str = RENDER_ENGINE, tile_size: int = 64) -> list[dict]:
+    """ Multi-view `render_scene`: the same scene seen from several cameras (typically one set of intrinsics at
+    different poses, see `PinholeCamera.with_pose`), one output dict per camera. The object centres are
+    projected into all cameras in one batched operation, only the rasterization runs per view. """
+    projection = project_views(scene, cameras)
+    return [render_scene(scene, camera, engine, tile_size, projection=tuple(a[k] for a in projection))
+            for k, camera in enumerate(cameras)]
 
-        proj = camera.project(obj.position)
-        if proj is None: #wara el camera
-            continue
-        u, v, z = proj
-        if u < 0 or u >= W or v < 0 or v >= H: #barat el image
-            continue
+def _render_zbuffer(scene, camera, projection):
 
-        #pixel size conversion
-        s_avg = float(sum(obj.scale) / 3.0)
-        base = int(round(SIZE_K * (s_avg / z)))
-        base = max(1, base)
+    H, W = camera.height, camera.width
+    rgb, depth, semantic, instance = _empty_buffers(H, W)
+
+    visible, u_all, v_all, z_all, base_all = projection
+    colors = to_u8(scene.color_rgb)
+    class_ids = scene.class_id
+    instance_ids = scene.instance_id
+    shapes = scene.shape_code
+
+    for k in np.flatnonzero(visible):  # the rest is behind the camera or outside the image
+        u, v, z, base = int(u_all[k]), int(v_all[k]), float(z_all[k]), int(base_all[k])
+        shape = SHAPES[shapes[k]].value
 
-        if obj.shape.value == "sphere":
+        if shape == "sphere":
             ras = raster_circle(u, v, base, W, H)
-        elif obj.shape.value == "cube":
+        elif shape == "cube":
             ras = raster_rect(u, v, base, W, H)
         else:
             ras = raster_ellipse(u, v, rx=base, ry=max(1, base // 2), w=W, h=H)
@@ -80,16 +141,15 @@ def render_scene(scene, camera):
         depth[ys, xs] = depth_patch
 
         semantic_patch = semantic[ys, xs]
-        semantic_patch[closer] = obj.class_id
+        semantic_patch[closer] = class_ids[k]
         semantic[ys, xs] = semantic_patch
 
         instance_patch = instance[ys, xs]
-        instance_patch[closer] = obj.instance_id
+        instance_patch[closer] = instance_ids[k]
         instance[ys, xs] = instance_patch
 
         rgb_patch = rgb[ys, xs]
-        color_u8 = to_u8(obj.color_rgb)
-        rgb_patch[closer] = color_u8
+        rgb_patch[closer] = colors[k]
         rgb[ys, xs] = rgb_patch
 
     return {
@@ -98,3 +158,89 @@ def render_scene(scene, camera):
         "semantic": semantic,
         "instance": instance,
     }
+
+def _footprints(scene, projection):
+    """ Screen-space footprint of every visible object, sorted front to back.
+    Ties in (float32) depth keep scene order, which is what the strict `<` of the Z-buffer does. """
+    visible, u, v, z, base = projection
+    idx = np.flatnonzero(visible)
+    z32 = z[idx].astype(np.float32)
+    order = idx[np.argsort(z32, kind="stable")]
+
+    shape = scene.shape_code[order]
+    base = base[order]
+    rx = base
+    ry = np.where(shape == SHAPES.index(Shape.cylinder), np.maximum(1, base // 2), base)
+    return {
+        "index": order,
+        "u": u[order],
+        "v": v[order],
+        "z": z[order].astype(np.float32),
+        "shape": shape,
+        "rx": rx,
+        "ry": ry,
+    }
+
+def _tile_free(W, H, tile):
+    """ Pixels per `tile` x `tile` tile of the image (edge tiles are smaller). """
+    th = np.minimum(tile, H - np.arange(0, H, tile))
+    tw = np.minimum(tile, W - np.arange(0, W, tile))
+    return np.outer(th, tw)
+
+def _render_tiled(scene, camera, tile: int, projection):
+
+    H, W = camera.height, camera.width
+    fp = _footprints(scene, projection)
+    bg = len(fp["index"])
+
+    # objects arrive front to back, so the first one covering a pixel owns it for good: every pixel is written
+    # once, and an object whose tiles are all full is hidden and skipped without looking at its pixels
+    owner = np.full((H, W), bg, dtype=np.int32)
+    free = _tile_free(W, H, tile)
+    u, v, rx, ry = fp["u"], fp["v"], fp["rx"], fp["ry"]
+    boxes = zip(fp["shape"].tolist(), u.tolist(), v.tolist(), rx.tolist(), ry.tolist(),
+                np.maximum(0, u - rx).tolist(), np.maximum(0, v - ry).tolist(),
+                np.minimum(W - 1, u + rx).tolist(), np.minimum(H - 1, v + ry).tolist())
+    for rank, (shape, cu, cv, a, b, x0, y0, x1, y1) in enumerate(boxes):
+        tiles = free[y0 // tile:y1 // tile + 1, x0 // tile:x1 // tile + 1]
+        if not tiles.any():
+            continue
+        # same stamps as raster.py, clipped to the image
+        stamp = shape_stamp(_STAMP_KIND[shape], a, b)[y0 - (cv - b):y1 - (cv - b) + 1, x0 - (cu - a):x1 - (cu - a) + 1]
+        window = owner[y0:y1 + 1, x0:x1 + 1]
+        take = stamp & (window == bg)
+        window[take] = rank
+        # pixels taken per tile of the box
+        rows = np.add.reduceat(take, np.r_[0, np.arange((y0 // tile + 1) * tile, y1 + 1, tile) - y0], axis=0)
+        tiles -= np.add.reduceat(rows, np.r_[0, np.arange((x0 // tile + 1) * tile, x1 + 1, tile) - x0], axis=1)
+
+    # per-object lookup tables in front-to-back order, plus a trailing background row
+    idx = fp["index"]
+    z_lut = np.r_[fp["z"], np.float32(DEPTH_INF)].astype(np.float32)
+    sem_lut = np.r_[scene.class_id[idx], 0].astype(np.int32)
+    ins_lut = np.r_[scene.instance_id[idx], 0].astype(np.int32)
+    rgb_lut = np.vstack([to_u8(scene.color_rgb)[idx], np.zeros((1, 3), dtype=np.uint8)])
+
+    if (H * W - free.sum()) * 8 < H * W:
+        # mostly background: write the covered pixels into background buffers
+        rgb, depth, semantic, instance = _empty_buffers(H, W)
+        at = np.flatnonzero(owner != bg)
+        own = owner.reshape(-1)[at]
+        depth.reshape(-1)[at] = z_lut[own]
+        semantic.reshape(-1)[at] = sem_lut[own]
+        instance.reshape(-1)[at] = ins_lut[own]
+        rgb.reshape(-1, 3)[at] = rgb_lut[own]
+    else:
+        # one gather per buffer over the whole image, background included
+        own = owner.astype(np.intp)
+        depth = np.take(z_lut, own, mode="clip")
+        semantic = np.take(sem_lut, own, mode="clip")
+        instance = np.take(ins_lut, own, mode="clip")
+        rgb = np.take(rgb_lut, own, axis=0, mode="clip")
+
+    return {
+        "rgb": rgb,
+        "depth": depth,
+        "semantic": semantic,
+        "instance": instance,
+    }
@@ -9,45 +9,130 @@
 * Supports configurable object counts
 
 **Key point:** The `color_rgb` field should be a **random color per instance**, not derived from the semantic class. This ensures RGB images look visually varied while semantic masks show consistent class groupings.
+
+Overlap avoidance (`overlap=`):
+
+* `"allow"`  -- objects are placed independently (default)
+* `"world"`  -- bounding spheres in 3D must not intersect
+* `"screen"` -- projected footprints must not intersect, so no object occludes another (needs the camera,
+  by default one with the config intrinsics at the origin)
+
+An object gets `max_attempts` candidate positions, the first one being the position `"allow"` would use. The
+first candidate that clears the already placed objects wins; an object with no free candidate is left out, so
+crowded scenes come back with fewer than `num_objects` objects. Candidates are only tested against objects in
+the neighbouring cells of a uniform grid (`_SpatialHash`), which keeps placement near O(n). All candidates
+are drawn up front, so the result only depends on the seed. With `"screen"`, candidates behind a posed camera
+are never drawn, so they are always free and take no room from the others.
 """
 
+import itertools
+import math
 import numpy as np
-from .scene import Scene
-from .scene_object import SceneObject, Shape
+from .scene import Scene, SHAPE_CODES
+from .scene_object import Shape
 from .library import CLASS_LIBRARY
+from config import X_RANGE, Y_RANGE, Z_RANGE, SIZE_K, FX, FY, CX, CY
+
+_CLASS_IDS = np.array(sorted(CLASS_LIBRARY.keys()), dtype=np.int32)
+# class id -> shape code lookup table, so the shape of every object is one fancy-index away
+_SHAPE_OF_CLASS = np.zeros(_CLASS_IDS.max() + 1, dtype=np.int8)
+for _cid, _entry in CLASS_LIBRARY.items():
+    _SHAPE_OF_CLASS[_cid] = SHAPE_CODES[Shape(_entry["shape"])]
+
+_POS_LOW = np.array([X_RANGE[0], Y_RANGE[0], Z_RANGE[0]])
+_POS_HIGH = np.array([X_RANGE[1], Y_RANGE[1], Z_RANGE[1]])
+
+class _SpatialHash:
+    """ Uniform grid over circles (2D) or spheres (3D). Every item is registered in all cells its bounding box
+    touches, so two intersecting items always share a cell. """
+
+    def __init__(self, cell: float):
+        self.cell = cell
+        self._cells = {}
+        self._items = []
+
+    # plain floats and tuples, numpy scalars would dominate the cost of these tiny checks
+    def _keys(self, center, r):
+        return itertools.product(*(range(math.floor((c - r) / self.cell), math.floor((c + r) / self.cell) + 1) for c in center))
 
-def generate_scene(num_objects: int, seed: int = 42) -> Scene:
+    def collides(self, center, r) -> bool:
+        for key in self._keys(center, r):
+            for j in self._cells.get(key, ()):
+                c, rj = self._items[j]
+                if sum((a - b) ** 2 for a, b in zip(c, center)) < (r + rj) ** 2:
+                    return True
+        return False
+
+    def insert(self, center, r) -> None:
+        self._items.append((center, r))
+        for key in self._keys(center, r):
+            self._cells.setdefault(key, []).append(len(self._items) - 1)
+
+def _bounds(candidates, s, overlap, camera):
+    """ Centers and radii of the bounding sphere ("world") or projected circle ("screen") of every candidate.
+    Candidates behind the camera get radius 0. """
+    fx, fy, cx, cy = (FX, FY, CX, CY) if camera is None else (camera.fx, camera.fy, camera.cx, camera.cy)
+    # the renderer draws a billboard of half size SIZE_K * s / z px, that is SIZE_K * s / fx world units at any
+    # depth; sqrt(2) stretches the bounding circle over the corners of cube squares
+    r = np.sqrt(2.0) * SIZE_K * s[:, None] / fx
+    if overlap == "world":
+        return candidates, np.broadcast_to(r, candidates.shape[:2])
+    if camera is not None:
+        candidates = camera.world_to_camera(candidates)
+    x, y, z = candidates[..., 0], candidates[..., 1], candidates[..., 2]
+    front = z > 0
+    z = np.where(front, z, 1.0)
+    centers = np.stack([fx * x / z + cx, fy * y / z + cy], axis=-1)
+    return centers, np.where(front, r * fx / z + 1.0, 0.0)  # +1 px for the rounding of centers and sizes to whole pixels
+
+def _place(centers, radii) -> np.ndarray:
+    """ Index of the first free candidate of every object, -1 when none is free. Candidates of radius 0 take no
+    room and are always free. """
+    sized = radii[radii > 0]
+    grid = _SpatialHash(cell=2.0 * float(np.median(sized)) if len(sized) else 1.0)
+    chosen = np.full(len(centers), -1)
+    for i, (cands, rs) in enumerate(zip(centers.tolist(), radii.tolist())):
+        for k, (c, r) in enumerate(zip(cands, rs)):
+            if r <= 0:
+                chosen[i] = k
+                break
+            if not grid.collides(c, r):
+                grid.insert(c, r)
+                chosen[i] = k
+                break
+    return chosen
+
+def generate_scene(num_objects: int, seed: int = 42, overlap: str = "allow", max_attempts: int = 32, camera=None) -> Scene:
+    if overlap not in ("allow", "world", "screen"):
+        raise ValueError(f"overlap must be 'allow', 'world' or 'screen', got {overlap!r}")
+
+    # every attribute is drawn for all objects at once, a handful of rng calls per scene instead of ~11 per object
     rng = np.random.default_rng(seed)
+    n = num_objects
+
+    class_id = rng.choice(_CLASS_IDS, size=n) #mnna2e id => mna3rf ayya shape
+    position = rng.uniform(_POS_LOW, _POS_HIGH, size=(n, 3))
+    rotation = rng.uniform(-np.pi, np.pi, size=(n, 3)) # roll, pitch, yaw
+    s = rng.uniform(0.3, 1.2, size=n)
+    color = rng.random((n, 3))
+
+    if overlap != "allow" and n > 0:
+        extra = rng.uniform(_POS_LOW, _POS_HIGH, size=(n, max_attempts - 1, 3))
+        candidates = np.concatenate([position[:, None], extra], axis=1)
+        chosen = _place(*_bounds(candidates, s, overlap, camera))
+        keep = np.flatnonzero(chosen >= 0)
+        position = candidates[keep, chosen[keep]]
+        class_id, rotation, s, color = class_id[keep], rotation[keep], s[keep], color[keep]
+        n = len(keep)
+
     scene = Scene()
-    class_ids = list(CLASS_LIBRARY.keys())
-
-    for i in range(num_objects):
-
-        class_id = int(rng.choice(class_ids)) #mnna2e id => mna3rf ayya shape
-        shape_str = CLASS_LIBRARY[class_id]["shape"] #okok so ayya shape 
-        shape = Shape(shape_str)  #mn2lob el string enum
-        instance_id = i + 1
-        x = float(rng.uniform(-2.0, 2.0))
-        y = float(rng.uniform(-2.0, 2.0))
-        z = float(rng.uniform(3.0, 8.0)) #haydole reasonable ranges 
-        roll  = float(rng.uniform(-np.pi, np.pi))
-        pitch = float(rng.uniform(-np.pi, np.pi))
-        yaw   = float(rng.uniform(-np.pi, np.pi))
-        s = float(rng.uniform(0.3, 1.2))
-        scale = (s, s, s)  
-        color = tuple(float(c) for c in rng.random(3))
-
-        obj = SceneObject(
-            name=f"obj_{instance_id}",
-            shape=shape,
-            class_id=class_id,
-            instance_id=instance_id,
-            position=(x, y, z),
-            rotation_rpy=(roll, pitch, yaw),
-            scale=scale,
-            color_rgb=color,
-        )
-
-        scene.add(obj)
-
-    return scene
\ No newline at end of file
+    scene.add_columns(
+        shape=_SHAPE_OF_CLASS[class_id],
+        class_id=class_id,
+        instance_id=np.arange(1, n + 1),
+        position=position,
+        rotation_rpy=rotation,
+        scale=np.repeat(s[:, None], 3, axis=1),  # uniform scale
+        color_rgb=color,
+    )
+    return scene
@@ -9,34 +9,194 @@
 # e5r so2al bi part 1 
 
 from __future__ import annotations
+import itertools
 from typing import List, Dict
-from .scene_object import SceneObject
+import numpy as np
+from .scene_object import SceneObject, Shape
+
+# shared across all scenes so a freshly generated scene never reuses the version of the one it replaced
+_VERSIONS = itertools.count(1)
+
+# columns store the shape as a small integer code, SHAPES[code] gives the enum back
+SHAPES = tuple(Shape)
+SHAPE_CODES = {shape: code for code, shape in enumerate(SHAPES)}
+
+_VEC3_COLUMNS = ("position", "rotation_rpy", "scale", "color_rgb")
 
 class Scene:
+    """ Objects are stored column-wise in NumPy arrays (one row per object) so generation, rendering and
+    serialization can work on whole columns. `SceneObject` models are only built when `objects` is read. """
+
     def __init__(self):
-        self.objects: List[SceneObject] = []
-        self._next_instance_id: int = 1 
+        self._n = 0
+        self._cols: Dict[str, np.ndarray] = {}
+        self._names: List[str | None] = []  # None means the default "obj_<instance_id>"
+        self._alloc(16)
+        self._objects: List[SceneObject] | None = None
+        self._next_instance_id: int = 1
+        self.version: int = next(_VERSIONS)
+
+    def _alloc(self, capacity: int) -> None:
+        cols = {name: np.zeros((capacity, 3), dtype=np.float64) for name in _VEC3_COLUMNS}
+        cols["class_id"] = np.zeros(capacity, dtype=np.int32)
+        cols["instance_id"] = np.zeros(capacity, dtype=np.int64)
+        cols["shape"] = np.zeros(capacity, dtype=np.int8)
+        for name, old in self._cols.items():
+            cols[name][:self._n] = old[:self._n]
+        self._cols = cols
+
+    def _reserve(self, extra: int) -> None:
+        capacity = len(self._cols["class_id"])
+        if self._n + extra > capacity:
+            self._alloc(max(self._n + extra, 2 * capacity))
+
+    def _touch(self) -> None:
+        self._objects = None
+        self.version = next(_VERSIONS)
+
+    def __len__(self) -> int:
+        return self._n
+
+    # read-only column views, one row per object
+    def _column(self, name: str) -> np.ndarray:
+        view = self._cols[name][:self._n]
+        view.flags.writeable = False
+        return view
+
+    @property
+    def position(self) -> np.ndarray:
+        return self._column("position")
+
+    @property
+    def rotation_rpy(self) -> np.ndarray:
+        return self._column("rotation_rpy")
+
+    @property
+    def scale(self) -> np.ndarray:
+        return self._column("scale")
+
+    @property
+    def color_rgb(self) -> np.ndarray:
+        return self._column("color_rgb")
+
+    @property
+    def class_id(self) -> np.ndarray:
+        return self._column("class_id")
+
+    @property
+    def instance_id(self) -> np.ndarray:
+        return self._column("instance_id")
+
+    @property
+    def shape_code(self) -> np.ndarray:
+        return self._column("shape")
+
+    def _name(self, i: int, instance_id: int) -> str:
+        name = self._names[i]
+        return f"obj_{instance_id}" if name is None else name
+
+    @property
+    def objects(self) -> List[SceneObject]:
+        if self._objects is None:
+            rows = self._rows()
+            # columns were validated on the way in, so skip pydantic validation here
+            self._objects = [SceneObject.model_construct(**row) for row in rows]
+        return self._objects
+
+    def _rows(self) -> List[Dict]:
+        cols = {name: self._column(name).tolist() for name in self._cols}
+        return [
+            {
+                "name": self._name(i, cols["instance_id"][i]),
+                "shape": SHAPES[cols["shape"][i]],
+                "class_id": cols["class_id"][i],
+                "instance_id": cols["instance_id"][i],
+                "position": tuple(cols["position"][i]),
+                "rotation_rpy": tuple(cols["rotation_rpy"][i]),
+                "scale": tuple(cols["scale"][i]),
+                "color_rgb": tuple(cols["color_rgb"][i]),
+            }
+            for i in range(self._n)
+        ]
 
     def add(self, obj: SceneObject) -> None:
-        self.objects.append(obj)
+        self._reserve(1)
+        i = self._n
+        for name in _VEC3_COLUMNS:
+            self._cols[name][i] = getattr(obj, name)
+        self._cols["class_id"][i] = obj.class_id
+        self._cols["instance_id"][i] = obj.instance_id
+        self._cols["shape"][i] = SHAPE_CODES[Shape(obj.shape)]
+        self._names.append(obj.name)
+        self._n += 1
         if obj.instance_id >= self._next_instance_id:
             self._next_instance_id = obj.instance_id + 1
+        self._touch()
+
+    def add_columns(self, *, shape, class_id, instance_id, position, rotation_rpy, scale, color_rgb, names=None) -> None:
+        """ Bulk version of `add()`: append one object per row. `shape` holds codes into `SHAPES`.
+        Validation mirrors `SceneObject` but runs once per column instead of once per object. """
+        shape = np.asarray(shape, dtype=np.int8)
+        class_id = np.asarray(class_id, dtype=np.int32)
+        instance_id = np.asarray(instance_id, dtype=np.int64)
+        vec3 = {
+            "position": np.asarray(position, dtype=np.float64),
+            "rotation_rpy": np.asarray(rotation_rpy, dtype=np.float64),
+            "scale": np.asarray(scale, dtype=np.float64),
+            "color_rgb": np.asarray(color_rgb, dtype=np.float64),
+        }
+        n = len(class_id)
+        if any(len(a) != n for a in (shape, instance_id, *vec3.values())) or any(a.shape != (n, 3) for a in vec3.values()):
+            raise ValueError("all columns must have one row per object (vectors as (n, 3))")
+        if names is not None and len(names) != n:
+            raise ValueError("names must have one entry per object")
+        if n == 0:
+            return
+        if np.any((shape < 0) | (shape >= len(SHAPES))):
+            raise ValueError("shape codes must index SHAPES")
+        if class_id.min() < 1 or instance_id.min() < 1:
+            raise ValueError("class_id and instance_id must be >= 1")
+        if np.any((vec3["color_rgb"] < 0) | (vec3["color_rgb"] > 1)):
+            raise ValueError("color_rgb must be in [0,1]")
+
+        self._reserve(n)
+        rows = slice(self._n, self._n + n)
+        for name, arr in vec3.items():
+            self._cols[name][rows] = arr
+        self._cols["class_id"][rows] = class_id
+        self._cols["instance_id"][rows] = instance_id
+        self._cols["shape"][rows] = shape
+        self._names.extend([None] * n if names is None else names)
+        self._n += n
+        self._next_instance_id = max(self._next_instance_id, int(instance_id.max()) + 1)
+        self._touch()
+
+    def columns(self) -> Dict:
+        """ The scene as `add_columns` keyword arguments, so `Scene().add_columns(**scene.columns())` copies it. """
+        return {
+            "shape": self.shape_code,
+            "class_id": self.class_id,
+            "instance_id": self.instance_id,
+            "position": self.position,
+            "rotation_rpy": self.rotation_rpy,
+            "scale": self.scale,
+            "color_rgb": self.color_rgb,
+            "names": list(self._names),
+        }
 
     def reset(self) -> None:
-        self.objects.clear()
+        self._n = 0
+        self._names.clear()
         self._next_instance_id = 1
+        self._touch()
 
     def to_dict(self) -> Dict:
         return {
-            "num_objects": len(self.objects),
-            "objects": [o.model_dump() for o in self.objects],
+            "num_objects": self._n,
+            "objects": self._rows(),
         }
 
     def new_instance_id(self) -> int:
         iid = self._next_instance_id
         self._next_instance_id += 1
         return iid
-
-    
-
-    
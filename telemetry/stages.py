@@ -0,0 +1,46 @@
+""" Pipeline stage timing.
+
+`stage(name)` times a block (or, as a decorator, every call of a function) into the `synth_stage_duration_seconds`
+histogram. Inside `profile()` the stage timings are also collected per request, which is how the API answers the
+`X-Profile` header with a `Server-Timing` breakdown (see `api/instrument.py`). The collection is a context
+variable, so it follows a request into the threadpool but not into worker processes.
+
+Stages: `generate`, `scene_to_dict`, `json_serialize`, `render`, `annotate`, `png_encode`, `array_encode`,
+`backproject`, `pointcloud_build`, `decimate`, `ply_write`, `open3d`, `render_worker` (time waiting for a render
+worker process, which does the render and encode stages itself). """
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from .metrics import Counter, Histogram
+
+STAGE_SECONDS = Histogram("synth_stage_duration_seconds", "Time spent per pipeline stage.", ("stage",))
+SCENES_RENDERED = Counter("synth_scenes_rendered_total", "Scenes (views) rasterized.")
+OBJECTS_RASTERIZED = Counter("synth_objects_rasterized_total", "Objects drawn by the rasterizer (visible ones only).")
+POINTS_EXPORTED = Counter("synth_points_exported_total", "Points written to PLY files.")
+EXPORT_SCENES = Counter("synth_export_scenes_total", "Scenes finished by dataset exports and streams.")
+
+_PROFILE = ContextVar("synth_profile", default=None)  # list of (stage, seconds) while profiling
+
+@contextmanager
+def stage(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        timings = _PROFILE.get()
+        if timings is not None:
+            timings.append((name, elapsed))
+
+@contextmanager
+def profile():
+    """ Collect the stage timings of everything run in this context, yields the (stage, seconds) list. """
+    timings = []
+    token = _PROFILE.set(timings)
+    try:
+        yield timings
+    finally:
+        _PROFILE.reset(token)